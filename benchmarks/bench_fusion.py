@@ -0,0 +1,71 @@
+"""
+Throughput of chains of line maps and filters, fused into one loop against one generator per stage.
+
+Run with `python -m benchmarks.bench_fusion [n_lines]` from the repository root.
+"""
+
+import sys
+from time import perf_counter
+
+from shell_extensions_python.fd import FD
+from shell_extensions_python.pipeline import Pipeline, MappedPipeline
+from shell_extensions_python.pipeline_map import LineMap, FilterMap
+
+class Lines(Pipeline):
+    """
+    A pipeline standing in for the output of a process
+    """
+    def __init__(self, count):
+        super().__init__()
+        self.count = count
+    def _lines(self):
+        return ((FD.stdout, i) for i in range(self.count))
+    def _end(self):
+        return 0
+
+def stages(length):
+    """
+    Alternating map and filter stages, all of which keep every line
+    """
+    return [LineMap(lambda x: x + 1, {FD.stdout}) if i % 2 == 0 else FilterMap(lambda x: x >= 0, {FD.stdout})
+            for i in range(length)]
+
+def unfused(count, length):
+    """
+    One MappedPipeline, and so one generator, per stage
+    """
+    pipeline = Lines(count)
+    for stage in stages(length):
+        pipeline = MappedPipeline(pipeline, stage)
+    return pipeline
+
+def fused(count, length):
+    """
+    The same stages added with |, which fuses them into a single FusedMap
+    """
+    pipeline = Lines(count)
+    for stage in stages(length):
+        pipeline = pipeline | stage
+    return pipeline
+
+def measure(make_pipeline, count, length):
+    """
+    Returns the number of lines per second that pass through the pipeline
+    """
+    start = perf_counter()
+    total = sum(1 for _ in make_pipeline(count, length))
+    assert total == count
+    return total / (perf_counter() - start)
+
+def main(count):
+    """
+    Prints the throughput of fused and unfused chains of several lengths
+    """
+    print("%-8s %14s %14s %8s" % ("stages", "unfused/s", "fused/s", "speedup"))
+    for length in 1, 2, 4, 8, 16:
+        slow = measure(unfused, count, length)
+        fast = measure(fused, count, length)
+        print("%-8s %14.0f %14.0f %7.2fx" % (length, slow, fast, fast / slow))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
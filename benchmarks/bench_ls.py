@@ -0,0 +1,72 @@
+"""
+Time taken by `ls` on a large directory, against listing it with os.listdir and classifying each
+    path separately, as `ls` used to. Both listings are classified, as they are when displayed, and
+    the time `ls` takes when the paths are only used as strings, and so never classified, is
+    also shown.
+
+Run with `python -m benchmarks.bench_ls [n_files]` from the repository root.
+"""
+
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+from shell_extensions_python import ls
+from shell_extensions_python.interactive import DisplayPath, FileType
+
+def populate(directory, count):
+    """
+    Fills the directory with files, a tenth of them executable, and some subdirectories and links
+    """
+    for i in range(count):
+        path = os.path.join(directory, "file%d" % i)
+        with open(path, "w"):
+            pass
+        if i % 10 == 0:
+            os.chmod(path, 0o755)
+        if i % 100 == 0:
+            os.mkdir(os.path.join(directory, "dir%d" % i))
+            os.symlink(path, os.path.join(directory, "link%d" % i))
+
+def listdir_ls(path):
+    """
+    The listing as `ls` used to produce it, with a classification of each path from scratch
+    """
+    return sorted(DisplayPath(name, path, FileType.classify(os.path.join(path, name))) for name in os.listdir(path))
+
+def scandir_ls(path):
+    """
+    The listing `ls` produces, classified as it is when displayed
+    """
+    result = ls(path)
+    for listed in result:
+        listed.type # pylint: disable=pointless-statement
+    return result
+
+def measure(list_directory, path):
+    """
+    Returns the best time in seconds of several listings of the directory, and the listing
+    """
+    times = []
+    for _ in range(3):
+        start = perf_counter()
+        result = list_directory(path)
+        times.append(perf_counter() - start)
+    return min(times), result
+
+def main(count):
+    """
+    Prints the time taken by both listings
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        populate(directory, count)
+        slow, old = measure(listdir_ls, directory)
+        fast, new = measure(scandir_ls, directory)
+        unclassified, _ = measure(ls, directory)
+        assert [path.type for path in old] == [path.type for path in new]
+        print("%-10s %12s %12s %8s %17s" % ("entries", "listdir (s)", "scandir (s)", "speedup", "unclassified (s)"))
+        print("%-10s %12.4f %12.4f %7.2fx %17.4f" % (len(new), slow, fast, slow / fast, unclassified))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,64 @@
+"""
+Throughput of searching for many fixed strings at once, with one pass per string against a single
+    pass of a MultiMatcher.
+
+Run with `python -m benchmarks.bench_multigrep [n_lines]` from the repository root.
+"""
+
+import random
+import sys
+from time import perf_counter
+
+from shell_extensions_python.grep import FixedMatcher, MultiMatcher
+
+def keywords(count):
+    """
+    Error codes such as E1234, which share prefixes with each other
+    """
+    return ["E%04d" % code for code in random.Random(0).sample(range(10000), count)]
+
+def lines(count):
+    """
+    Log lines, a few of which contain an error code
+    """
+    rng = random.Random(1)
+    return ["request %d took %dms status E%04d\n" % (i, rng.randrange(1000), rng.randrange(10000))
+            for i in range(count)]
+
+def one_pass_per_pattern(patterns, data):
+    """
+    Searches each line once for each pattern
+    """
+    matchers = [FixedMatcher(pattern) for pattern in patterns]
+    return sum(1 for line in data if any(matcher.search(line) for matcher in matchers))
+
+def single_pass(patterns, data):
+    """
+    Searches each line once for all the patterns
+    """
+    matcher = MultiMatcher(patterns, fixed=True)
+    return sum(1 for line in data if matcher.search(line))
+
+def measure(search, patterns, data):
+    """
+    Returns the number of lines per second searched, and the number of lines that match
+    """
+    start = perf_counter()
+    matched = search(patterns, data)
+    return len(data) / (perf_counter() - start), matched
+
+def main(count):
+    """
+    Prints the throughput of both approaches for several numbers of patterns
+    """
+    data = lines(count)
+    print("%-9s %14s %14s %8s" % ("patterns", "per pattern/s", "single pass/s", "speedup"))
+    for n_patterns in 10, 100, 1000:
+        patterns = keywords(n_patterns)
+        slow, slow_matched = measure(one_pass_per_pattern, patterns, data)
+        fast, fast_matched = measure(single_pass, patterns, data)
+        assert slow_matched == fast_matched
+        print("%-9s %14.0f %14.0f %7.2fx" % (n_patterns, slow, fast, fast / slow))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
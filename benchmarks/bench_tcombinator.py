@@ -0,0 +1,90 @@
+"""
+Throughput of TCombinator against the original single-slot SemaphoreTCombinator.
+
+Run with `python -m benchmarks.bench_tcombinator [n_items]` from the repository root.
+"""
+
+import sys
+from threading import Semaphore, Thread
+from time import perf_counter
+
+from shell_extensions_python.tcombinator import TCombinator, EOF
+
+class SIGSEGV:
+    """
+    If you're happy and you know it...
+    """
+    pass
+SIGSEGV = SIGSEGV()
+
+class SemaphoreTCombinator:
+    """
+    The original TCombinator, which hands over one value at a time through a single slot.
+        Kept here as the baseline
+    """
+    def __init__(self, *generators):
+        self.buffer = SIGSEGV
+        self.spaces_available = Semaphore(1)
+        self.items_present = Semaphore(0)
+        self.n_threads = len(generators)
+        for generator in generators:
+            thread = Thread(target=self._thread, args=[generator])
+            thread.start()
+
+    def _thread(self, generator):
+        """
+        A thread that consumes the given generator and pushes each value onto the stack
+        """
+        while True:
+            try:
+                item = next(generator)
+            except StopIteration:
+                item = EOF
+            self.spaces_available.acquire()
+            self.buffer = item
+            self.items_present.release()
+            if item == EOF:
+                break
+
+    def __iter__(self):
+        threads_remaining = self.n_threads
+        while True:
+            self.items_present.acquire()
+            item = self.buffer
+            assert item is not SIGSEGV
+            if item != EOF:
+                yield self.buffer
+                self.buffer = SIGSEGV
+            else:
+                threads_remaining -= 1
+            self.spaces_available.release()
+            if threads_remaining == 0:
+                break
+
+def lines(count, tag):
+    """
+    A generator standing in for the lines of a process's output
+    """
+    return ((tag, "line %s\n" % i) for i in range(count))
+
+def measure(combinator, count, **kwargs):
+    """
+    Returns the number of items per second the combinator passes through from two generators
+    """
+    start = perf_counter()
+    total = sum(1 for _ in combinator(lines(count, 1), lines(count, 2), **kwargs))
+    assert total == 2 * count
+    return total / (perf_counter() - start)
+
+def main(count):
+    """
+    Prints the throughput of each implementation
+    """
+    print("%-32s %14s" % ("implementation", "items/s"))
+    print("%-32s %14.0f" % ("SemaphoreTCombinator", measure(SemaphoreTCombinator, count)))
+    for capacity in 16, 1024, 65536:
+        print("%-32s %14.0f" % ("TCombinator(capacity=%s)" % capacity,
+                                measure(TCombinator, count, capacity=capacity)))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
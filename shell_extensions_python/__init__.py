@@ -8,15 +8,18 @@ from tempfile import NamedTemporaryFile
 
 from . import git
 
-from .basic_shell_programs import ls, read, pwd, cd, globs, glob, mkdir, write, rm, mv, move_to, whoami, \
+from .basic_shell_programs import ls, read, pwd, cd, globs, iglobs, glob, mkdir, write, rm, mv, move_to, whoami, \
     symlink, CannotRemoveDirectoryError
-from .run_shell_commands import r, re, s, throw, less, cp, ProcessFailedException, cat
+from .run_shell_commands import r, re, s, se, throw, less, cp, ProcessFailedException, cat
+from .async_pipeline import ase, ashell
+from .parallel import parallel
 from .pipeline_consumer import Terminal, Collect
 from .shell_pickles import pload, ploads, psaves, psave
-from .pipeline_map import sort, head, retain
-from .grep import cgrep
+from .pipeline_map import sort, head, retain, tail, window, dedupe_adjacent, sample, pmap
+from .grep import cgrep, grep, grep_files, rgrep
+from .walk import find
 from .fd import FD
-from .collectors import Stdout, Stderr, Both
+from .collectors import Stdout, Stderr, Both, Count, GroupBy, TopK, Histogram, Columns
 from .mapping import col, cols
 
 from .colors import PrintColors
@@ -0,0 +1,83 @@
+"""
+Runs synchronous code that consumes an iterable over an asynchronous stream, in a separate thread
+"""
+
+import asyncio
+import queue
+from threading import Thread
+
+QUEUE_SIZE = 1024
+
+class _End:
+    """
+    Marks the end of a stream passed between the event loop and the worker thread
+    """
+_END = _End()
+
+class _Failure:
+    """
+    An exception raised by the worker thread, to be re-raised on the event loop
+    """
+    def __init__(self, exception):
+        self.exception = exception
+
+async def iterate_in_thread(func, stream):
+    """
+    Calls `func` in a separate thread on a blocking iterator over the items of the asynchronous
+        iterable `stream`, and asynchronously yields the values of the iterable `func` returns
+
+    At most QUEUE_SIZE items are waiting for the thread at any time: the event loop stops reading
+        `stream` until the thread has caught up. If `func` returns before reading all the items,
+        `stream` is closed, cancelling the processes it runs
+    """
+    loop = asyncio.get_running_loop()
+    inputs = queue.Queue()
+    space = asyncio.Semaphore(QUEUE_SIZE)
+    outputs = asyncio.Queue()
+    def put(item):
+        loop.call_soon_threadsafe(outputs.put_nowait, item)
+    def get():
+        item = inputs.get()
+        loop.call_soon_threadsafe(space.release)
+        return item
+    def run():
+        try:
+            for item in func(iter(get, _END)):
+                put(item)
+            put(_END)
+        except BaseException as e: # pylint: disable=broad-except
+            put(_Failure(e))
+    items = stream.__aiter__()
+    async def feed():
+        try:
+            async for item in items:
+                await space.acquire()
+                inputs.put(item)
+        finally:
+            inputs.put(_END)
+    Thread(target=run, daemon=True).start()
+    feeder = asyncio.ensure_future(feed())
+    try:
+        while True:
+            item = await outputs.get()
+            if item is _END:
+                break
+            if isinstance(item, _Failure):
+                raise item.exception
+            yield item
+        if feeder.done():
+            await feeder
+    finally:
+        if not feeder.done():
+            # the thread no longer reads the inputs, so the feeder may be waiting for space forever
+            feeder.cancel()
+            await asyncio.wait([feeder])
+            await items.aclose()
+
+async def call_in_thread(func, stream):
+    """
+    Calls `func` in a separate thread on a blocking iterator over the items of the asynchronous
+        iterable `stream`, and returns its result
+    """
+    [result] = [result async for result in iterate_in_thread(lambda items: [func(items)], stream)]
+    return result
@@ -0,0 +1,219 @@
+"""
+Asynchronous pipelines, which support the same operations as pipelines but are consumed from an
+    asyncio event loop, so that many processes can be run concurrently from a single thread.
+
+    async for fd, line in ase('ls'): ...
+    result = await (ashell('make') > Collect)
+"""
+
+import asyncio
+from abc import ABCMeta, abstractmethod
+
+from .async_bridge import call_in_thread
+from .collectors import CollectOutput
+from .fd import FD
+from .pipeline_map import fuse, to_pipeline_map
+from .pipeline_result import PipelineResult
+from .process_readers import LineSplitter, READ_SIZE
+from .run_shell_commands import CANCELLED_EXITCODES
+from .shell_types import NoNewline
+
+class AsyncPipeline(metaclass=ABCMeta):
+    """
+    The asynchronous counterpart of Pipeline. Operators that run the pipeline (`>`, `>=`)
+        return coroutines, and the pipeline itself can be awaited, which is equivalent to `> None`
+    """
+    def __init__(self):
+        self._exitcode = None
+    @abstractmethod
+    def _lines(self): # pragma: no cover
+        """
+        Asynchronously yields several (FD, str) representing lines and the file descriptors
+            they find themselves on
+        """
+        pass
+    @abstractmethod
+    async def _end(self): # pragma: no cover
+        """
+        Ends the pipeline, performing cleanup, and returing an exit code.
+
+        Only to be called once _lines is exhausted
+        """
+        pass
+    async def __aiter__(self):
+        async for fd, line in self._lines():
+            yield fd, line
+        self._exitcode = await self._end()
+    @property
+    def exitcode(self):
+        """
+        Get the exit code for the underlying process. Throws an error if the process isn't complete
+        """
+        if self._exitcode is not None:
+            return self._exitcode
+        raise RuntimeError("No exit code for the current process")
+    def __await__(self):
+        return (self > None).__await__()
+    def __gt__(self, consumer_type):
+        """
+        Returns a coroutine that runs the given shell consumer on the contents of this pipeline
+        """
+        return self._consume(consumer_type)
+    async def _consume(self, consumer_type):
+        if consumer_type is None:
+            async for _ in self:
+                pass
+            return PipelineResult([], [], self.exitcode)
+        consumer = consumer_type()
+        async for fd, line in self:
+            consumer.consume(fd, line)
+        return PipelineResult(consumer.stdout(), consumer.stderr(), self.exitcode)
+    def __ge__(self, collector):
+        """
+        Returns a coroutine that runs collector(self). Built-in collectors run on the event loop,
+            any other function is run in a separate thread
+        """
+        if isinstance(collector, CollectOutput):
+            return collector.acall(self)
+        return self._collect_in_thread(collector)
+    async def _collect_in_thread(self, collector):
+        # the lines are closed if the collector returns early, which cancels the processes
+        result = await call_in_thread(collector, self._lines())
+        self._exitcode = await self._end()
+        return result
+    def __or__(self, mapper):
+        """
+        Maps the given mapper over this pipeline, see Pipeline.__or__
+        """
+        return self._map(mapper, {FD.stdout})
+    def __truediv__(self, mapper):
+        """
+        Maps the given mapper over this pipeline, see Pipeline.__truediv__
+        """
+        return self._map(mapper, {FD.stderr})
+    def __mod__(self, mapper):
+        """
+        Maps the given mapper over this pipeline, see Pipeline.__mod__
+        """
+        return self._map(mapper, {FD.stdout, FD.stderr})
+    def _map(self, mapper, fds):
+        """
+        Map the given mapper over this pipeline. If the mapper is just a function, map over fds
+        """
+        return AsyncMappedPipeline(self, to_pipeline_map(mapper, fds))
+
+class AsyncMappedPipeline(AsyncPipeline):
+    """
+    Represents the result of a map operation on an asynchronous pipeline. If the mapper stops
+        early, the underlying pipeline is closed, see MappedPipeline
+    """
+    def __init__(self, pipeline, mapper):
+        super().__init__()
+        self.__pipeline = pipeline
+        self.__mapper = mapper
+    async def _lines(self):
+        # pylint: disable=W0212
+        lines = self.__pipeline._lines()
+        mapped = self.__mapper.amap(lines)
+        try:
+            async for fd, line in mapped:
+                yield fd, line
+        finally:
+            await mapped.aclose()
+            await lines.aclose()
+    async def _end(self):
+        # pylint: disable=W0212
+        return await self.__pipeline._end()
+    def _map(self, mapper, fds):
+        """
+        Maps the given mapper over this pipeline, fusing it with this pipeline's mapper if possible
+        """
+        mapper = to_pipeline_map(mapper, fds)
+        fused = fuse(self.__mapper, mapper)
+        if fused is None:
+            return AsyncMappedPipeline(self, mapper)
+        return AsyncMappedPipeline(self.__pipeline, fused)
+
+class AsyncProcess(AsyncPipeline):
+    """
+    An asynchronous pipeline created by the standard out and error of a process.
+        The process is started the first time the pipeline is iterated
+
+    If the consumer stops reading early, the process is terminated, see Process
+    """
+    def __init__(self, command, shell, print_direct, raw_bytes):
+        super().__init__()
+        self.command = command
+        self.shell = shell
+        self.print_direct = print_direct
+        self.raw_bytes = raw_bytes
+        self.proc = None
+        self.__cancelled = False
+    async def _start(self):
+        pipe = None if self.print_direct else asyncio.subprocess.PIPE
+        if self.shell:
+            self.proc = await asyncio.create_subprocess_shell(self.command, stdout=pipe, stderr=pipe)
+        else:
+            self.proc = await asyncio.create_subprocess_exec(*self.command, stdout=pipe, stderr=pipe)
+    async def _lines(self):
+        if self.proc is None:
+            await self._start()
+        if self.print_direct:
+            return
+        readers = {}
+        for fd, stream in (FD.stdout, self.proc.stdout), (FD.stderr, self.proc.stderr):
+            readers[asyncio.ensure_future(stream.read(READ_SIZE))] = fd, stream, LineSplitter()
+        try:
+            while readers:
+                done, _ = await asyncio.wait(readers, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=lambda task: readers[task][0].value):
+                    fd, stream, splitter = readers.pop(task)
+                    block = task.result()
+                    if block:
+                        readers[asyncio.ensure_future(stream.read(READ_SIZE))] = fd, stream, splitter
+                        lines = splitter.feed(block)
+                    else:
+                        lines = splitter.finish()
+                    for line in lines:
+                        yield fd, self.__encode(line)
+        finally:
+            if readers:
+                for task in readers:
+                    task.cancel()
+                self.__cancelled = True
+                try:
+                    self.proc.terminate()
+                except ProcessLookupError:
+                    pass
+                # wait only returns once the pipes are closed, which is never seen if they are no
+                #   longer read. Closing them also stops any processes the shell started
+                for fd in 1, 2:
+                    self.proc._transport.get_pipe_transport(fd).close() # pylint: disable=protected-access
+    async def _end(self):
+        if self.proc is None:
+            # the output was closed before it was read, so there is no need to run the process
+            return 0
+        exitcode = await self.proc.wait()
+        if self.__cancelled and exitcode in CANCELLED_EXITCODES:
+            return 0
+        return exitcode
+    def __encode(self, line):
+        if self.raw_bytes:
+            return line
+        return NoNewline(line.decode('utf-8'))
+
+def ase(*command, print_direct=False, raw_bytes=False):
+    """
+    The asynchronous version of se: run the given command without shell expansion
+    """
+    if not all(isinstance(x, str) for x in command):
+        raise RuntimeError("Cannot run %s: it has non-string elements" % (command,))
+    return AsyncProcess(command, False, print_direct, raw_bytes)
+
+def ashell(command, print_direct=False, raw_bytes=False):
+    """
+    The asynchronous version of s: run the given command with shell expansion
+    """
+    if not isinstance(command, str):
+        raise RuntimeError("command argument to ashell must be of type str but was %s" % type(command))
+    return AsyncProcess(command, True, print_direct, raw_bytes)
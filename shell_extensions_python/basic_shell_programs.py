@@ -10,11 +10,15 @@ import errno
 import getpass
 
 import glob as pyglob
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+from itertools import islice
 
 from .autorun import autorun
 from .shell_types import ShellStr, ShellList, ShellBool
 from .path_manipulation import expand_user, join, basename, dirname
-from .interactive import Interactive, DisplayPath
+from .interactive import Interactive, Listing
+from .run_shell_commands import cat
 
 @autorun
 def ls(path='.', sort_key=lambda x: x, a=True, full=False):
@@ -23,10 +27,15 @@ def ls(path='.', sort_key=lambda x: x, a=True, full=False):
 
     path: the directory to list the contents of
     sort_key: the key by which to sort the results, or None if you don't want the results sorted.
+
+    The directory is read with os.scandir. The paths are only classified, for coloring, once one of
+        them is displayed, and then all at once using the types it gives and at most one stat
+        each, see Listing and FileType.classify_entry
     """
     path = expand_user(path)
-    result = os.listdir(path)
-    result = [DisplayPath(spath, context=path) for spath in result]
+    listing = Listing(path)
+    with os.scandir(path) as entries:
+        result = [listing.add(entry) for entry in entries]
     if sort_key is not None:
         result.sort(key=sort_key)
     if not a:
@@ -46,6 +55,9 @@ def read(filename, mode=''):
 def write(filename, contents, clobber=False, append=False):
     """
     Write the contents to the given file
+
+    contents: a string, or a `cat` of another file, which is copied without being read into python.
+        Returns false if the cat could not read its file
     """
     if clobber and append:
         raise ValueError("clobbering and appending are mutually exclusive")
@@ -55,6 +67,9 @@ def write(filename, contents, clobber=False, append=False):
         mode = 'a'
     else:
         mode = 'x'
+    if isinstance(contents, cat):
+        with open(filename, mode + 'b') as f:
+            return ShellBool.create(contents._copy_to(f) == 0) # pylint: disable=protected-access
     with open(filename, mode) as f:
         f.write(contents)
     return ShellBool.true
@@ -73,7 +88,10 @@ class CannotRemoveDirectoryError(OSError):
     def __init__(self, path):
         super().__init__("Cannot remove directory %s, it has contents" % path)
 
-def rm(*paths, ignore_missing=False, recursively=False, interactive=True):
+REMOVE_CHUNK = 256
+
+def rm(*paths, ignore_missing=False, recursively=False, interactive=True, jobs=None, progress=None,
+       dry_run=False):
     """
     Removes the given collection of normal files and empty folders. If any removal is illegal,
         no files are removed.
@@ -81,40 +99,130 @@ def rm(*paths, ignore_missing=False, recursively=False, interactive=True):
     ignore_missing: do not error if the file does not exist
     recursively: remove a directory recursively if it contains values
     interactive: prompt rather than erroring if you encounter a file you are not allowed to delete
+    jobs: the number of threads to remove the files with. By default, one per CPU, plus a few
+        since removal mostly waits on the file system
+    progress: a function called with the number of paths removed so far and the total number
+        of paths to remove, after each batch of removals
+    dry_run: do not remove anything, and instead return the paths that would be removed, in the
+        order they would be
+
+    All the paths are checked, and any directories to be removed recursively are listed with
+        os.scandir, before anything is removed, see RemovalPlan
     """
-    removes = [_rm(path, ignore_missing, recursively, interactive) for path in paths]
-    for remove in removes:
-        remove()
+    plan = RemovalPlan()
+    for path in paths:
+        plan.add(path, ignore_missing, recursively, interactive)
+    if dry_run:
+        return ShellList(plan.paths())
+    plan.execute(jobs or min(32, (os.cpu_count() or 1) + 4), progress)
+    return None
 
-def _rm(path, ignore_missing, recursively, interactive):
+class RemovalPlan:
     """
-    Returns a command that removes the given path, or raises an error if it does not work
+    The files and directories to remove, found by listing each directory once.
 
-    See `rm` for the meanings of the arguments
+    The files, which include links, are removed first, in parallel, and then the directories,
+        deepest first, with those at the same depth removed in parallel
     """
-    path = expand_user(path)
-    if not os.path.exists(path):
-        if ignore_missing:
-            return lambda: None
-        else:
+    def __init__(self):
+        self.files = []
+        self.directories = []
+        self.__seen = set()
+    def add(self, path, ignore_missing, recursively, interactive):
+        """
+        Adds the given path to the plan, or raises an error if it cannot be removed
+
+        See `rm` for the meanings of the arguments
+        """
+        path = expand_user(path)
+        if not os.path.exists(path):
+            if ignore_missing:
+                return
             raise FileNotFoundError("The file %s cannot be removed as it does not exist" % path)
-    elif os.path.islink(path) or os.path.isfile(path):
-        return lambda: os.remove(path)
-    elif os.path.isdir(path):
-        if ls(path) == []:
-            return lambda: os.rmdir(path)
-        elif recursively:
-            return lambda: shutil.rmtree(path)
-        elif interactive:
-            if Interactive.ask_question(("Are you sure you want to remove %s:" \
-                    + " it is a directory with contents [yN]: ") % path) == 'y':
-                return lambda: shutil.rmtree(path)
-            return lambda: None
+        elif os.path.islink(path) or os.path.isfile(path):
+            self.__add_file(path)
+        elif os.path.isdir(path):
+            with os.scandir(path) as scan:
+                entries = list(scan)
+            if not entries:
+                self.__add_directory(path)
+            elif recursively:
+                self.__add_tree(path, entries)
+            elif interactive:
+                if Interactive.ask_question(("Are you sure you want to remove %s:" \
+                        + " it is a directory with contents [yN]: ") % path) == 'y':
+                    self.__add_tree(path, entries)
+            else:
+                raise CannotRemoveDirectoryError(path)
         else:
-            raise CannotRemoveDirectoryError(path)
-    else:
-        raise RuntimeError("The path %s represents an existing file"
-                           + " that is not a directory, normal file, or link" % path)
+            raise RuntimeError(("The path %s represents an existing file"
+                                + " that is not a directory, normal file, or link") % path)
+    def __add_tree(self, path, entries):
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                with os.scandir(entry.path) as scan:
+                    self.__add_tree(entry.path, list(scan))
+            else:
+                self.__add_file(entry.path)
+        self.__add_directory(path)
+    def __add_file(self, path):
+        if self.__first_time(path):
+            self.files.append(path)
+    def __add_directory(self, path):
+        if self.__first_time(path):
+            self.directories.append(path)
+    def __first_time(self, path):
+        """
+        Whether the path has not been added yet, so that a path given twice, or inside a directory
+            that is also being removed, is only removed once
+        """
+        key = os.path.normpath(os.path.abspath(path))
+        if key in self.__seen:
+            return False
+        self.__seen.add(key)
+        return True
+    def paths(self):
+        """
+        The paths to remove, in the order they are removed
+        """
+        return self.files + [path for level in self.__levels() for path in level]
+    def __levels(self):
+        """
+        The directories grouped by depth, deepest first. The directories within a group contain
+            none of each other, so can be removed in any order
+        """
+        by_depth = {}
+        for path in self.directories:
+            by_depth.setdefault(os.path.normpath(os.path.abspath(path)).count(os.sep), []).append(path)
+        return [by_depth[depth] for depth in sorted(by_depth, reverse=True)]
+    def execute(self, jobs, progress=None):
+        """
+        Removes the paths in the plan, using `jobs` threads, and calling progress(removed, total)
+            after each batch
+        """
+        total = len(self.files) + len(self.directories)
+        removed = 0
+        executor = ThreadPoolExecutor(jobs) if jobs > 1 and total > REMOVE_CHUNK else None
+        try:
+            for remove, paths in [(os.remove, self.files)] + [(os.rmdir, level) for level in self.__levels()]:
+                chunks = [paths[start:start + REMOVE_CHUNK] for start in range(0, len(paths), REMOVE_CHUNK)]
+                done = map(_remove_all, [remove] * len(chunks), chunks) if executor is None \
+                    else executor.map(_remove_all, [remove] * len(chunks), chunks)
+                for count in done:
+                    removed += count
+                    if progress is not None:
+                        progress(removed, total)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+def _remove_all(remove, paths):
+    """
+    Removes each of the paths with the given function, returning the number removed
+    """
+    for path in paths:
+        remove(path)
+    return len(paths)
 
 def mv(src, dst, overwrite=False, create_dir=True):
     """
@@ -207,17 +315,102 @@ def globs(glob_str):
     """
     Returns all the possible glob expansions of the given string
     """
-    return sorted(pyglob.glob(expand_user(glob_str)))
+    return sorted(iglobs(glob_str))
+
+def iglobs(glob_str, sort=False, recursive=False):
+    """
+    Lazily yields the possible glob expansions of the given string, in no particular order.
+
+    sort: yield the expansions sorted within each directory, each directory's matches in the
+        order of their names. The directories are listed one at a time with os.scandir as the
+        expansions are consumed, so only one listing per level is held in memory rather than
+        every match, as a global sort would need
+    recursive: `**` matches any number of directories, rather than acting like `*`
+    """
+    glob_str = expand_user(glob_str)
+    if not sort:
+        return pyglob.iglob(glob_str, recursive=recursive)
+    if os.path.isabs(glob_str):
+        directory, glob_str = os.sep, glob_str.lstrip(os.sep)
+    else:
+        directory = ''
+    parts = glob_str.split(os.sep)
+    if not recursive:
+        parts = ['*' if part == '**' else part for part in parts]
+    # consecutive **s match the same paths as one
+    parts = [part for i, part in enumerate(parts) if not (part == '**' and i > 0 and parts[i - 1] == '**')]
+    return _sorted_glob(directory, parts)
+
+def _sorted_glob(directory, parts):
+    """
+    Yields the paths under the directory matching the given components, see iglobs
+    """
+    part, rest = parts[0], parts[1:]
+    if not pyglob.has_magic(part):
+        path = os.path.join(directory, part)
+        if not rest:
+            if os.path.lexists(path):
+                yield path
+        elif os.path.isdir(path):
+            yield from _sorted_glob_directory(path, rest)
+        return
+    try:
+        with os.scandir(directory or os.curdir) as scan:
+            entries = sorted((entry.name, entry.is_dir()) for entry in scan)
+    except OSError:
+        return
+    if part == '**' and rest == [''] and directory:
+        # a trailing **/ matches the directory itself, as directory/
+        yield os.path.join(directory, '')
+    for name, is_dir in entries:
+        if part != '**':
+            yield from _sorted_glob_entry(directory, name, is_dir, parts)
+            continue
+        if rest:
+            # the ** matches no directories, so the rest of the pattern decides if hidden names match
+            yield from _sorted_glob_entry(directory, name, is_dir, rest)
+        elif not name.startswith('.'):
+            yield os.path.join(directory, name)
+        # like glob.glob, ** does not match hidden directories
+        if is_dir and not name.startswith('.') and not os.path.islink(os.path.join(directory, name)):
+            yield from _sorted_glob(os.path.join(directory, name), parts)
+
+def _sorted_glob_entry(directory, name, is_dir, parts):
+    """
+    Yields the paths matching the given components that start with the given entry of the directory
+    """
+    part, rest = parts[0], parts[1:]
+    if name.startswith('.') and not part.startswith('.'):
+        return
+    if not fnmatch(name, part):
+        return
+    path = os.path.join(directory, name)
+    if not rest:
+        yield path
+    elif is_dir:
+        yield from _sorted_glob_directory(path, rest)
+
+def _sorted_glob_directory(path, parts):
+    """
+    Yields the paths under the directory at path matching the given components. Like glob.glob, a
+        trailing ** also matches the directory itself, as path/
+    """
+    if parts == ['**']:
+        yield os.path.join(path, '')
+    yield from _sorted_glob(path, parts)
 
 def glob(glob_str):
     """
     Returns one glob expansion of the given string. If no match is found or multiple matches are found, it should crash.
+
+    Stops looking as soon as a second match is found
     """
-    results = globs(glob_str)
+    results = list(islice(iglobs(glob_str), 2))
     if not results:
         raise RuntimeError("No matches for %s" % glob_str)
     elif len(results) > 1:
-        raise RuntimeError("Multiple matches for %s: %s matches found" % (glob_str, len(results)))
+        raise RuntimeError("Multiple matches for %s: at least 2 matches (%s, ...)"
+                           % (glob_str, ", ".join(sorted(results))))
     else:
         return results[0]
 
@@ -2,7 +2,26 @@
 Classes collecting outputs
 """
 
+import bisect
+import heapq
+import math
+from abc import ABCMeta, abstractmethod
+from array import array
+from collections import Counter
+from itertools import count
+from operator import itemgetter
+
+try:
+    import numpy
+except ImportError: # pragma: no cover
+    numpy = None
+
 from .fd import FD
+from .pipeline import Pipeline
+
+COLUMN_CHUNK = 1 << 14
+
+TYPECODES = {float: 'd', int: 'q'}
 
 class CollectOutput:
     """
@@ -12,7 +31,17 @@ class CollectOutput:
         self.__dtype = dtype
         self.__fds = fds
     def __call__(self, pipeline):
-        results = self.__dtype(line for fd, line in pipeline if fd in self.__fds)
+        if isinstance(pipeline, Pipeline):
+            lines = (line for fd, lines in pipeline.batches() if fd in self.__fds for line in lines)
+        else:
+            lines = (line for fd, line in pipeline if fd in self.__fds)
+        results = self.__dtype(lines)
+        return results
+    async def acall(self, pipeline):
+        """
+        Collects the outputs of the given asynchronous pipeline, on the event loop
+        """
+        results = self.__dtype([line async for fd, line in pipeline if fd in self.__fds])
         return results
 
 class Stdout(CollectOutput):
@@ -35,3 +64,218 @@ class Both(CollectOutput):
     """
     def __init__(self, dtype=tuple):
         super().__init__(dtype, {FD.stdout, FD.stderr})
+
+class Aggregate(CollectOutput, metaclass=ABCMeta):
+    """
+    Collects the outputs corresponding to the given file descriptors by folding them into a single
+        value one at a time, so that only that value is held in memory.
+
+    Subclasses implement `start`, which returns the initial state, `add`, which returns the state
+        after seeing a line, and `result`, which converts the final state to the result
+    """
+    def __init__(self, fds):
+        super().__init__(self.__fold, fds)
+        self.__fds = fds
+    @abstractmethod
+    def start(self): # pragma: no cover
+        """
+        Returns the state before any lines have been seen
+        """
+        pass
+    @abstractmethod
+    def add(self, state, line): # pragma: no cover
+        """
+        Returns the state after seeing the given line
+        """
+        pass
+    def result(self, state):
+        """
+        Returns the result for the given final state
+        """
+        return state
+    def __fold(self, lines):
+        state = self.start()
+        for line in lines:
+            state = self.add(state, line)
+        return self.result(state)
+    async def acall(self, pipeline):
+        state = self.start()
+        async for fd, line in pipeline:
+            if fd in self.__fds:
+                state = self.add(state, line)
+        return self.result(state)
+
+class Count(Aggregate):
+    """
+    Counts the lines
+    """
+    def __init__(self, fds=frozenset({FD.stdout})):
+        super().__init__(fds)
+    def start(self):
+        return 0
+    def add(self, state, line):
+        return state + 1
+
+class GroupBy(Aggregate):
+    """
+    Groups the lines by `key`, returning a dictionary from each key to the result for its group.
+        What the result is depends on `dtype`:
+
+    Counter: the number of lines in the group, or the sum of `value` over them, as a Counter
+    an Aggregate, e.g., TopK(3): the result of the aggregate over the `value`s in the group
+    any other type, e.g., list: the `value`s in the group collected into that type. Note that this
+        holds every value in memory
+
+    For example, `pipeline | str.split >= GroupBy(col(2), Counter)` counts the lines per third column
+    """
+    def __init__(self, key, dtype=Counter, value=None, fds=frozenset({FD.stdout})):
+        super().__init__(fds)
+        self.__key = key
+        self.__dtype = dtype
+        self.__value = value
+    def start(self):
+        if self.__is_counter():
+            return Counter()
+        return {}
+    def add(self, state, line):
+        key = self.__key(line)
+        value = line if self.__value is None else self.__value(line)
+        if self.__is_counter():
+            state[key] += 1 if self.__value is None else value
+        elif isinstance(self.__dtype, Aggregate):
+            if key not in state:
+                state[key] = self.__dtype.start()
+            state[key] = self.__dtype.add(state[key], value)
+        else:
+            state.setdefault(key, []).append(value)
+        return state
+    def result(self, state):
+        if self.__is_counter():
+            return state
+        if isinstance(self.__dtype, Aggregate):
+            return {key: self.__dtype.result(group) for key, group in state.items()}
+        return {key: self.__dtype(group) for key, group in state.items()}
+    def __is_counter(self):
+        return isinstance(self.__dtype, type) and issubclass(self.__dtype, Counter)
+
+class TopK(Aggregate):
+    """
+    Collects the `k` lines with the largest `key` into a tuple, largest first. Ties are broken in
+        favor of the earlier line. Only `k` lines are held in memory
+    """
+    def __init__(self, k, key=lambda x: x, fds=frozenset({FD.stdout})):
+        super().__init__(fds)
+        self.__k = k
+        self.__key = key
+    def start(self):
+        return [], count()
+    def add(self, state, line):
+        heap, index = state
+        item = (self.__key(line), -next(index), line)
+        if len(heap) < self.__k:
+            heapq.heappush(heap, item)
+        elif self.__k > 0 and item[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, item)
+        return state
+    def result(self, state):
+        heap, _ = state
+        return tuple(line for _, _, line in sorted(heap, key=lambda item: item[:2], reverse=True))
+
+class Histogram(Aggregate):
+    """
+    Counts the values of `key` over the lines in bins.
+
+    bins: either a sorted sequence of bin edges, in which case the result is a tuple of counts, the
+        ith counting the values in [bins[i], bins[i + 1]) (the last bin also includes its right
+        edge), with values outside all the bins ignored, or a bin width, in which case the result
+        is a dictionary from the start of each bin that has values in it to its count, in order
+    """
+    def __init__(self, bins, key=float, fds=frozenset({FD.stdout})):
+        super().__init__(fds)
+        if isinstance(bins, (int, float)):
+            if bins <= 0:
+                raise ValueError("bin width should be positive but was %s" % bins)
+        elif len(bins) < 2:
+            raise ValueError("there should be at least two bin edges but there were %s" % len(bins))
+        self.__bins = bins
+        self.__key = key
+    def start(self):
+        if isinstance(self.__bins, (int, float)):
+            return Counter()
+        return [0] * (len(self.__bins) - 1)
+    def add(self, state, line):
+        value = self.__key(line)
+        if isinstance(self.__bins, (int, float)):
+            state[math.floor(value / self.__bins) * self.__bins] += 1
+            return state
+        index = bisect.bisect_right(self.__bins, value) - 1
+        if value == self.__bins[-1]:
+            index -= 1
+        if 0 <= index < len(state):
+            state[index] += 1
+        return state
+    def result(self, state):
+        if isinstance(self.__bins, (int, float)):
+            return dict(sorted(state.items()))
+        return tuple(state)
+
+class Columns(Aggregate):
+    """
+    Collects the columns given by `columns`, a `col` or `cols`, of each line split with `split`
+        into arrays: a single array for a `col`, and a tuple of arrays for `cols`. Each column
+        has the type given to `col` or `cols`, or else `dtype`.
+
+    The lines are split and converted `chunk` lines at a time, so the fields are never held as
+        Python objects beyond a chunk. The arrays are numpy arrays if numpy is installed, and
+        otherwise `array.array`s, in which case the types should be int or float.
+
+    For example, `cat('report.txt') >= Columns(cols(0, (2, int)))` collects the first column as
+        floats and the third as ints
+    """
+    def __init__(self, columns, dtype=float, split=str.split, chunk=COLUMN_CHUNK, fds=frozenset({FD.stdout})):
+        super().__init__(fds)
+        if chunk < 1:
+            raise ValueError("chunk should be at least 1 but was %s" % chunk)
+        self.__columns = [(idx, dtype if typ is None else typ) for idx, typ in columns.idx_types]
+        if numpy is None:
+            for _, typ in self.__columns:
+                if typ not in TYPECODES:
+                    raise ValueError("without numpy, column types should be int or float but were %s" % typ)
+        self.__single = columns.single
+        self.__split = split
+        self.__chunk = chunk
+    def start(self):
+        return [], [[] for _ in self.__columns]
+    def add(self, state, line):
+        pending, chunks = state
+        pending.append(line)
+        if len(pending) >= self.__chunk:
+            self.__flush(pending, chunks)
+        return state
+    def result(self, state):
+        pending, chunks = state
+        self.__flush(pending, chunks)
+        arrays = tuple(self.__concatenate(typ, column) for (_, typ), column in zip(self.__columns, chunks))
+        return arrays[0] if self.__single else arrays
+    def __flush(self, pending, chunks):
+        """
+        Converts the pending lines to one chunk of each column
+        """
+        if not pending:
+            return
+        rows = list(map(self.__split, pending))
+        pending.clear()
+        for (idx, typ), column in zip(self.__columns, chunks):
+            fields = map(itemgetter(idx), rows)
+            if numpy is None:
+                column.append(array(TYPECODES[typ], map(typ, fields)))
+            else:
+                column.append(numpy.array(list(fields), dtype=typ))
+    @staticmethod
+    def __concatenate(typ, chunks):
+        if numpy is not None:
+            return numpy.concatenate(chunks) if chunks else numpy.array([], dtype=typ)
+        result = array(TYPECODES[typ])
+        for chunk in chunks:
+            result.extend(chunk)
+        return result
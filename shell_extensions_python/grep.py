@@ -2,56 +2,565 @@
 Contains various functions for searching through strings
 """
 
-import re
+import mmap
 import os
+import re
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from .colors import PrintColors
-from .shell_types import ShellStr
+from .fd import FD
+from .pipeline import Pipeline
+from .pipeline_map import BufferedMap, unbatch
+from .run_shell_commands import cat
+from .shell_types import ShellStr, NoNewline
+from .walk import walk
+
+BINARY_CHECK_SIZE = 8192
+
+class RegexMatcher:
+    """
+    Matches a regular expression, compiled once, against str or bytes lines
+    """
+    def __init__(self, pattern, ignore_case=False):
+        self.__pattern = pattern
+        self.__flags = re.IGNORECASE if ignore_case else 0
+        self.__compiled = {}
+        self.__buffer_pattern = None
+    def compiled(self, line):
+        """
+        Returns the compiled pattern for lines of the same type, str or bytes, as the given line
+        """
+        is_str = isinstance(line, str)
+        if is_str not in self.__compiled:
+            pattern = self.__pattern
+            if isinstance(pattern, str) and not is_str:
+                pattern = pattern.encode('utf-8')
+            elif isinstance(pattern, bytes) and is_str:
+                pattern = pattern.decode('utf-8')
+            self.__compiled[is_str] = re.compile(pattern, self.__flags)
+        return self.__compiled[is_str]
+    def search(self, line):
+        """
+        Whether the given line contains a match
+        """
+        return self.compiled(line).search(line) is not None
+    def spans(self, line):
+        """
+        Yields the (start, end, 0) of each match in the given line
+        """
+        for match in self.compiled(line).finditer(line):
+            yield match.start(), match.end(), 0
+    def find_in(self, buffer, start):
+        """
+        Returns the position of the first match in the given bytes-like buffer of several lines,
+            at or after start, or -1. A match may span several lines, so the line it starts on
+            should be checked with `search`
+        """
+        if self.__buffer_pattern is None:
+            pattern = self.__pattern.encode('utf-8') if isinstance(self.__pattern, str) else self.__pattern
+            self.__buffer_pattern = re.compile(pattern, self.__flags | re.MULTILINE)
+        match = self.__buffer_pattern.search(buffer, start)
+        return -1 if match is None else match.start()
+
+class FixedMatcher:
+    """
+    Matches a fixed string, without going through the regular expression engine
+    """
+    def __init__(self, string, ignore_case=False):
+        self.string = string
+        self.ignore_case = ignore_case
+        self.__needle = string.lower() if ignore_case else string
+        self.__buffer_needle = re.compile(re.escape(string.encode('utf-8')), re.IGNORECASE) if ignore_case \
+            else string.encode('utf-8')
+    def search(self, line):
+        """
+        Whether the given line contains the string
+        """
+        return self.__needle in self.__prepare(line)
+    def spans(self, line):
+        """
+        Yields the (start, end, 0) of each non-overlapping occurrence of the string in the given line
+        """
+        line = self.__prepare(line)
+        if not self.__needle:
+            return
+        start = line.find(self.__needle)
+        while start != -1:
+            end = start + len(self.__needle)
+            yield start, end, 0
+            start = line.find(self.__needle, end)
+    def find_in(self, buffer, start):
+        """
+        Returns the position of the first occurrence of the string in the given bytes-like buffer,
+            at or after start, or -1, see RegexMatcher.find_in
+        """
+        if isinstance(self.__buffer_needle, bytes):
+            return buffer.find(self.__buffer_needle, start)
+        match = self.__buffer_needle.search(buffer, start)
+        return -1 if match is None else match.start()
+    def __prepare(self, line):
+        if not isinstance(line, str):
+            line = str(line, 'utf-8')
+        return line.lower() if self.ignore_case else line
+
+class MultiMatcher(RegexMatcher):
+    """
+    Matches any of several patterns in a single pass, with one regular expression combining them.
+
+    Fixed strings are combined into a trie, e.g., ['cat', 'car'] into 'ca(?:r|t)', so that each
+        position is only compared against the strings sharing a prefix with it, and the longest
+        string matching at a position is found. Regular expressions are combined into an
+        alternation, of which the first that matches at a position is found. Since they are put
+        in numbered groups, they should not use numbered backreferences.
+
+    `spans` reports the index of the pattern each match is of
+    """
+    def __init__(self, patterns, fixed=False, ignore_case=False):
+        patterns = list(patterns)
+        if not patterns:
+            raise ValueError("there should be at least one pattern")
+        self.__fixed = fixed
+        self.__ignore_case = ignore_case
+        self.__indices = {}
+        if fixed:
+            for index, string in enumerate(patterns):
+                self.__indices.setdefault(string.lower() if ignore_case else string, index)
+            super().__init__(_trie_regex(patterns), ignore_case)
+        else:
+            # the group around each pattern is numbered after those around and in the ones before
+            group = 1
+            for index, pattern in enumerate(patterns):
+                self.__indices[group] = index
+                group += 1 + re.compile(pattern).groups
+            super().__init__("|".join("(%s)" % pattern for pattern in patterns), ignore_case)
+    def spans(self, line):
+        for match in self.compiled(line).finditer(line):
+            yield match.start(), match.end(), self.__index(match)
+    def __index(self, match):
+        if not self.__fixed:
+            # the group around the pattern that matched is closed after any groups inside it
+            return self.__indices[match.lastindex]
+        text = match.group()
+        if not isinstance(text, str):
+            text = text.decode('utf-8')
+        return self.__indices.get(text.lower() if self.__ignore_case else text, 0)
+
+def _trie_regex(strings):
+    """
+    Returns a regular expression matching any of the given strings, structured as their trie
+    """
+    trie = {}
+    for string in strings:
+        node = trie
+        for character in string:
+            node = node.setdefault(character, {})
+        node[""] = {}
+    return _node_regex(trie)
+
+def _node_regex(node):
+    alternatives = [re.escape(character) + _node_regex(child) for character, child in sorted(node.items())
+                    if character]
+    if not alternatives:
+        return ""
+    if len(alternatives) == 1 and "" not in node:
+        return alternatives[0]
+    # the alternatives are all longer than the empty string, so the longest match is preferred
+    return "(?:%s)%s" % ("|".join(alternatives), "?" if "" in node else "")
+
+def matcher(pattern, fixed=False, ignore_case=False):
+    """
+    Converts the given pattern to a matcher: a regular expression, or, if fixed, a string to be
+        matched literally. A list or tuple of patterns is matched in a single pass by a
+        MultiMatcher. Matchers are passed through unchanged
+    """
+    if hasattr(pattern, 'spans'):
+        return pattern
+    if isinstance(pattern, (list, tuple)):
+        return MultiMatcher(pattern, fixed, ignore_case)
+    if fixed:
+        return FixedMatcher(pattern, ignore_case)
+    return RegexMatcher(pattern, ignore_case)
+
+def render(components, color):
+    """
+    Renders the given (is a match component, component, pattern index) triples with the matches in
+        the given color. If `color` is a list of colors, each match is rendered in the color at the
+        index of its pattern, cycling through the colors
+    """
+    result = []
+    for is_match, component, index in components:
+        if not is_match:
+            result += [PrintColors.reset]
+        elif isinstance(color, (list, tuple)):
+            result += [color[index % len(color)]]
+        else:
+            result += [color]
+        result += [component]
+    return ShellStr("".join(result))
 
 class GreppedString(ShellStr):
     """
-    A string that represents the results of running grep on a string
+    A string that represents the results of running grep on a string.
+
+    Rather than a list of components, it stores the (start, end) offsets of its matches flattened
+        into `match_offsets`, an array, and the index of the pattern each is of in
+        `match_patterns`, so the matches take a few bytes each. The components are found from
+        these when they are needed, e.g., when the string is displayed
     """
-    def __new__(cls, components, color):
-        result = str.__new__(cls, "".join([component for _, component in components]))
-        result.components = components
+    def __new__(cls, text, match_offsets, match_patterns, color):
+        result = str.__new__(cls, text)
+        result.match_offsets = match_offsets
+        result.match_patterns = match_patterns
         result.color = color
         return result
+    @property
+    def components(self):
+        """
+        The (is a match component, component) pairs making up this string, with each line ending
+            in a non-match component
+        """
+        return [(is_match, component) for is_match, component, _ in self.__components()]
+    @property
+    def patterns(self):
+        """
+        The index of the pattern each component matches, or None if it is not a match
+        """
+        return [index for _, _, index in self.__components()]
+    def __components(self):
+        offsets, patterns = self.match_offsets, self.match_patterns
+        match = 0
+        line_start = 0
+        while line_start < len(self):
+            line_end = self.find(os.linesep, line_start)
+            line_end = len(self) if line_end == -1 else line_end + len(os.linesep)
+            prev = line_start
+            while match < len(patterns) and offsets[2 * match] < line_end:
+                start, end = offsets[2 * match], offsets[2 * match + 1]
+                yield False, self[prev:start], None
+                yield True, self[start:end], patterns[match]
+                prev = end
+                match += 1
+            yield False, self[prev:line_end], None
+            line_start = line_end
     def __repr__(self):
-        result = []
-        for is_match, component in self.components:
-            result += [self.color if is_match else PrintColors.reset]
-            result += [component]
-        return ShellStr("".join(result))
+        return render(self.__components(), self.color)
+    def __reduce__(self):
+        return GreppedString, (str.__str__(self), self.match_offsets, self.match_patterns, self.color)
 
-def collect_components_for_line(pattern, line):
+class GreppedLine(NoNewline):
     """
-    Gets the components of a line (whether match components or not)
-        pattern: the pattern to match
-        line: the line
+    A line selected by `grep`, after an optional prefix such as its filename. The match
+        components are only found when they are needed, e.g., when the line is displayed.
 
-        output: [(is a match component, component)]
+    Lines found in files also have the `path` of the file and their 1-based `line_number` in it
+    """
+    def __new__(cls, line, matcher, color, prefix="", path=None, line_number=None):
+        result = str.__new__(cls, prefix + line)
+        result.matcher = matcher
+        result.color = color
+        result.prefix_length = len(prefix)
+        result.path = path
+        result.line_number = line_number
+        return result
+    @property
+    def components(self):
+        """
+        The (is a match component, component) pairs making up this line
+        """
+        return [(is_match, component) for is_match, component, _ in self.__components()]
+    @property
+    def patterns(self):
+        """
+        The index of the pattern each component matches, or None if it is not a match
+        """
+        return [index for _, _, index in self.__components()]
+    def __components(self):
+        line = self[self.prefix_length:]
+        if self.prefix_length:
+            yield False, self[:self.prefix_length], None
+        yield from split_components(self.matcher.spans(line), line)
+    def __repr__(self):
+        return render(self.__components(), self.color)
+    def __reduce__(self):
+        line, prefix = self[self.prefix_length:], self[:self.prefix_length]
+        return GreppedLine, (line, self.matcher, self.color, prefix, self.path, self.line_number)
+
+def split_components(spans, line):
+    """
+    Splits the line into (is a match component, component, pattern index) triples at the given
+        (start, end, pattern index) spans
     """
     prev = 0
-    for match in re.finditer(pattern, line):
-        yield False, line[prev:match.start()]
-        yield True, line[match.start():match.end()]
-        prev = match.end()
-    yield False, line[prev:] + os.linesep
+    for start, end, index in spans:
+        yield False, line[prev:start], None
+        yield True, line[start:end], index
+        prev = end
+    yield False, line[prev:], None
 
-def collect_components(pattern, string, remove_lines):
+def cgrep(pattern, string, color=PrintColors.red_bright, remove_lines=True, fixed=False, ignore_case=False):
     """
-    Similar to collect_components_for_line but for an entire file
+    Our version of grep. If pattern is a list of patterns, the lines matching any of them are kept,
+        see MultiMatcher, and color can be a list of colors for the patterns
     """
+    pattern = matcher(pattern, fixed, ignore_case)
     if string.endswith(os.linesep):
         string = string[:-len(os.linesep)]
+    lines = []
+    offsets, patterns = array('q'), array('l')
+    position = 0
     for line in string.split(os.linesep):
-        components = list(collect_components_for_line(pattern, line))
-        if not remove_lines or any(is_match for is_match, _ in components):
-            yield from components
+        if remove_lines and not pattern.search(line):
+            continue
+        for start, end, index in pattern.spans(line):
+            offsets.extend((position + start, position + end))
+            patterns.append(index)
+        lines.append(line)
+        position += len(line) + len(os.linesep)
+    text = "".join(line + os.linesep for line in lines)
+    return GreppedString(text, offsets, patterns, color)
+
+SEPARATOR = NoNewline("--" + os.linesep)
 
-def cgrep(pattern, string, color=PrintColors.red_bright, remove_lines=True):
+def grep(pattern, fixed=False, ignore_case=False, invert=False, count=False, context=0,
+         color=PrintColors.red_bright):
     """
-    Our version of grep
+    A streaming grep, to be used as a map, e.g., `cat('app.log') | grep('ERROR')`. The pattern is
+        compiled once, and the selected lines are GreppedLines, which are only split into match
+        components when displayed.
+
+    pattern: a regular expression, or a list of them to match in a single pass, see MultiMatcher
+    fixed: match the pattern as a string rather than a regular expression, which is faster
+    ignore_case: match regardless of case
+    color: the color of the matches, or a list of colors, one for each pattern
+    invert: select the lines that do not match, like `grep -v`
+    count: instead of the lines, output the number of selected lines, like `grep -c`
+    context: output this many lines around each selected line, with `--` between the groups of
+        lines that are not adjacent, like `grep -C`
+    """
+    pattern = matcher(pattern, fixed, ignore_case)
+    class _Grep(BufferedMap):
+        def start(self):
+            self.__counts = {fd: 0 for fd in sorted(self.fds, key=lambda fd: fd.value)}
+            self.__before = deque(maxlen=context)
+            self.__after = 0
+            self.__index = 0
+            self.__last = None
+        def feed(self, fd, line):
+            index = self.__index
+            self.__index += 1
+            if pattern.search(line) == invert:
+                if self.__after:
+                    self.__after -= 1
+                    self.__last = index
+                    return [(fd, line)]
+                if context:
+                    self.__before.append((index, fd, line))
+                return ()
+            if count:
+                self.__counts[fd] += 1
+                return ()
+            result = []
+            first = self.__before[0][0] if self.__before else index
+            if context and self.__last is not None and first > self.__last + 1:
+                result.append((fd, SEPARATOR))
+            result += [(before_fd, before_line) for _, before_fd, before_line in self.__before]
+            self.__before.clear()
+            result.append((fd, line if invert or not isinstance(line, str) else GreppedLine(line, pattern, color)))
+            self.__after = context
+            self.__last = index
+            return result
+        def finish(self):
+            if not count:
+                return ()
+            return [(fd, NoNewline("%s%s" % (total, os.linesep))) for fd, total in self.__counts.items()]
+    return _Grep
+
+class GrepFiles(Pipeline):
+    """
+    A pipeline created by running `grep` over files, see `grep_files`
+    """
+    def __init__(self, pattern, filenames, files_with_matches, count, invert, grep_args):
+        super().__init__()
+        self.__matcher = pattern
+        self.__filenames = filenames
+        self.__files_with_matches = files_with_matches
+        self.__count = count
+        self.__invert = invert
+        self.__grep_args = grep_args
+        self.__matched = False
+        self.__failed = False
+    def _lines(self):
+        for filename in self.__filenames:
+            if self.__files_with_matches and self.__can_search_mapping():
+                if self.__contains(filename):
+                    yield FD.stdout, NoNewline(filename + os.linesep)
+            else:
+                yield from self.__search(filename)
+    def __can_search_mapping(self):
+        """
+        Whether a file contains a selected line exactly when its contents contain the pattern
+        """
+        return isinstance(self.__matcher, FixedMatcher) and not self.__matcher.ignore_case \
+            and not self.__invert and os.linesep not in self.__matcher.string
+    def __search(self, filename):
+        prefix = filename + ":" if len(self.__filenames) > 1 else ""
+        grep_map = grep(self.__matcher, invert=self.__invert, count=self.__count, **self.__grep_args)
+        mapped = cat(filename, memory_map=True) | grep_map
+        # pylint: disable=protected-access
+        lines = mapped._lines()
+        try:
+            for fd, line in lines:
+                if fd is FD.stderr:
+                    yield fd, line
+                    continue
+                self.__matched = self.__matched or not self.__count or line != "0" + os.linesep
+                if self.__files_with_matches:
+                    yield fd, NoNewline(filename + os.linesep)
+                    break
+                if isinstance(line, GreppedLine):
+                    yield fd, GreppedLine(line, line.matcher, line.color, prefix)
+                elif line is not SEPARATOR:
+                    yield fd, NoNewline(prefix + line)
+                else:
+                    yield fd, line
+        finally:
+            lines.close()
+        if mapped._end() != 0:
+            self.__failed = True
+    def __contains(self, filename):
+        """
+        Whether the file contains the fixed string, searched for over a memory mapping of the file
+        """
+        needle = self.__matcher.string.encode('utf-8')
+        try:
+            with open(filename, "rb") as handle:
+                if os.fstat(handle.fileno()).st_size == 0:
+                    return False
+                with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                    found = mapping.find(needle) != -1
+        except IOError:
+            self.__failed = True
+            return False
+        self.__matched = self.__matched or found
+        return found
+    def _end(self):
+        if self.__failed:
+            return 2
+        return 0 if self.__matched else 1
+
+def grep_files(pattern, *filenames, fixed=False, ignore_case=False, invert=False, count=False,
+               files_with_matches=False, context=0, color=PrintColors.red_bright):
+    """
+    Runs `grep` over the given files, which are memory mapped, and returns a pipeline of the
+        selected lines, prefixed by their filename if there are several files.
+
+    files_with_matches: instead of the lines, output the name of each file with a selected line,
+        like `grep -l`. Each file is only read up to its first selected line, and fixed strings
+        are searched for in the whole mapped file at once
+
+    See `grep` for the other arguments. Like grep, the exit code is 0 if a line was selected, 1 if
+        none were, and 2 if a file could not be read
+    """
+    return GrepFiles(matcher(pattern, fixed, ignore_case), filenames, files_with_matches, count, invert,
+                     dict(context=context, color=color))
+
+class RecursiveGrep(Pipeline):
+    """
+    A pipeline created by searching the files under a directory, see `rgrep`
+    """
+    def __init__(self, pattern, paths, jobs, files_with_matches, color):
+        super().__init__()
+        self.__matcher = pattern
+        self.__paths = paths
+        self.__jobs = jobs
+        self.__files_with_matches = files_with_matches
+        self.__color = color
+        self.__matched = False
+        self.__failed = False
+    def _lines(self):
+        return unbatch(self._batches())
+    def _batches(self):
+        with ThreadPoolExecutor(self.__jobs) as executor:
+            pending = deque()
+            try:
+                for path in self.__paths:
+                    pending.append(executor.submit(self.__search, path))
+                    if len(pending) >= 4 * self.__jobs:
+                        yield from self.__results(pending.popleft())
+                while pending:
+                    yield from self.__results(pending.popleft())
+            finally:
+                for future in pending:
+                    future.cancel()
+    def __results(self, future):
+        lines, errors = future.result()
+        if lines:
+            self.__matched = True
+            yield FD.stdout, lines
+        if errors:
+            self.__failed = True
+            yield FD.stderr, errors
+    def __search(self, path):
+        """
+        Returns the selected lines of the given file, which is memory mapped, and any errors.
+            Files with a null byte near their start are considered binary and skipped
+        """
+        try:
+            with open(path, "rb") as handle:
+                if os.fstat(handle.fileno()).st_size == 0 or b"\0" in handle.read(BINARY_CHECK_SIZE):
+                    return [], []
+                with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                    return list(self.__mapped_lines(path, mapping)), []
+        except OSError as e:
+            return [], [str(e).encode('utf-8')]
+    def __mapped_lines(self, path, mapping):
+        """
+        Yields the selected lines of the given mapping, jumping from one match to the next with
+            `find_in` rather than splitting the mapping into lines
+        """
+        position, line_number, counted = 0, 1, 0
+        while position < len(mapping):
+            start = self.__matcher.find_in(mapping, position)
+            if start == -1:
+                return
+            line_start = mapping.rfind(b"\n", 0, start) + 1
+            if line_start >= len(mapping):
+                return
+            line_end = mapping.find(b"\n", start)
+            position = len(mapping) if line_end == -1 else line_end + 1
+            line_number += mapping[counted:line_start].count(b"\n")
+            counted = line_start
+            line = str(mapping[line_start:position], 'utf-8', errors='replace')
+            if not self.__matcher.search(line):
+                continue
+            if self.__files_with_matches:
+                yield NoNewline(path + os.linesep)
+                return
+            if not line.endswith("\n"):
+                line += os.linesep
+            yield GreppedLine(line, self.__matcher, self.__color, "%s:%s:" % (path, line_number), path, line_number)
+    def _end(self):
+        if self.__failed:
+            return 2
+        return 0 if self.__matched else 1
+
+def rgrep(pattern, path=".", glob=None, jobs=None, fixed=False, ignore_case=False, files_with_matches=False,
+          gitignore=True, color=PrintColors.red_bright):
+    """
+    Searches the files under the given path, like `grep -R`, and returns a pipeline of the selected
+        lines as GreppedLines prefixed by their path and line number, in the order of the files.
+
+    The tree is walked with `walk.walk`, skipping the files ignored by .gitignore files unless
+        gitignore is False, and binary files are skipped. The files are memory mapped and searched
+        `jobs` at a time in a pool of threads.
+
+    glob: only search the files whose name matches this glob, e.g., '*.py'
+    files_with_matches: instead of the lines, output the paths of the files that match, like `-l`
+
+    See `grep` for the other arguments, and `grep_files` for the exit code
     """
-    return GreppedString(list(collect_components(pattern, string, remove_lines)), color)
+    jobs = jobs or min(32, (os.cpu_count() or 1) + 4)
+    return RecursiveGrep(matcher(pattern, fixed, ignore_case), walk(path, glob, gitignore), jobs,
+                         files_with_matches, color)
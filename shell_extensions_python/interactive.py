@@ -4,6 +4,7 @@ Contains functions relevant to user interaction.
 
 
 import os
+import stat
 import sys
 from enum import Enum
 from colorama import Fore, Style
@@ -43,17 +44,118 @@ class FileType(Enum):
             return FileType.executable
         return FileType.normal_file
 
+    @staticmethod
+    def classify_entry(entry, directory_stat):
+        """
+        Classifies the given os.DirEntry like `classify`, but using the type the directory listing
+            gives for it and a single stat, which the entry caches. Whether a directory is a mount
+            point is found by comparing it to `directory_stat`, the os.lstat of the directory
+            containing it, and whether a file is executable from the permissions in its stat
+        """
+        try:
+            if entry.is_symlink():
+                entry.stat()
+                return FileType.link
+            if entry.is_dir():
+                entry_stat = entry.stat(follow_symlinks=False)
+                if entry_stat.st_dev != directory_stat.st_dev or entry_stat.st_ino == directory_stat.st_ino:
+                    return FileType.link
+                return FileType.directory
+            if _is_executable(entry.path, entry.stat()):
+                return FileType.executable
+        except OSError:
+            # a broken link, or an entry deleted since the listing
+            return FileType.missing
+        return FileType.normal_file
+
+def _is_executable(path, path_stat):
+    """
+    Whether the file with the given stat is executable by this process, following the rules of
+        os.access(path, os.X_OK)
+    """
+    if not hasattr(os, 'geteuid'):
+        return os.access(path, os.X_OK)
+    mode = path_stat.st_mode
+    if os.geteuid() == 0:
+        return bool(mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH))
+    if path_stat.st_uid == os.geteuid():
+        return bool(mode & stat.S_IXUSR)
+    if path_stat.st_gid == os.getegid() or path_stat.st_gid in os.getgroups():
+        return bool(mode & stat.S_IXGRP)
+    return bool(mode & stat.S_IXOTH)
+
 class DisplayPath(str):
     """
     A display path, which is exactly like a string, except that it __repr__'s colored in.
+
+    The path is only classified when its `type` is first needed, e.g., when it is displayed, so
+        paths that are only used as strings cost no stats. Paths in a Listing are then classified
+        together with the rest of their listing
     """
-    def __new__(cls, path, context):
+    def __new__(cls, path, context, file_type=None, entry=None, listing=None):
         result = str.__new__(cls, path)
-        result.type = FileType.classify(join(context, path))
+        result.context = context
+        result.entry = entry
+        result.listing = listing
+        result.__type = file_type
         return result
+    @property
+    def type(self):
+        """
+        The FileType of this path
+        """
+        if self.__type is None:
+            if self.listing is None:
+                self.classify(None)
+            else:
+                self.listing.classify()
+        return self.__type
+    def classify(self, directory_stat):
+        """
+        Classifies this path if it has not been already, from its os.DirEntry if it has one and
+            directory_stat, the stat of the directory it is in, is given, see FileType.classify_entry
+        """
+        if self.__type is not None:
+            return
+        if self.entry is None or directory_stat is None:
+            self.__type = FileType.classify(join(self.context, self))
+        else:
+            self.__type = FileType.classify_entry(self.entry, directory_stat)
+        self.entry = None
     def __repr__(self): # pragma: no cover
         return self.type.value + super().__repr__() + Style.RESET_ALL
 
+class Listing:
+    """
+    The paths listed from one directory, which are all classified in one pass the first time the
+        type of any of them is needed
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.paths = []
+    def add(self, entry, full=False):
+        """
+        Returns a DisplayPath for the given os.DirEntry of the directory, as part of this listing.
+            The path is the entry's name, or, if full, its path including the directory
+        """
+        if full:
+            path = DisplayPath(entry.path, "", entry=entry, listing=self)
+        else:
+            path = DisplayPath(entry.name, self.directory, entry=entry, listing=self)
+        self.paths.append(path)
+        return path
+    def classify(self):
+        """
+        Classifies all the paths in this listing
+        """
+        try:
+            directory_stat = os.stat(self.directory)
+        except OSError:
+            directory_stat = None
+        for path in self.paths:
+            path.classify(directory_stat)
+        self.paths = []
+
 def is_displayed(value): # pragma: no cover
     """
     Whether or not the given value should be displayed on the screen
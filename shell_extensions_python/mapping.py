@@ -2,11 +2,52 @@
 Get the mapping out of the current `col`/`cols`
 """
 
-def col(idx, typ=lambda x: x):
+from operator import itemgetter
+
+class _Columns:
+    """
+    Gets the given columns of the underlying data, each cast with its type. Can be called on a
+        line, or, with `map_batch`, on a whole list of lines at once, see PipelineMap.map_batch
+    """
+    def __init__(self, idx_types, single):
+        self.__idxs = [idx_type[0] if isinstance(idx_type, tuple) else idx_type for idx_type in idx_types]
+        self.__typs = [idx_type[1] if isinstance(idx_type, tuple) else None for idx_type in idx_types]
+        self.__single = single
+    @property
+    def idx_types(self):
+        """
+        The (index, type) of each column, with a type of None if the column is not cast
+        """
+        return list(zip(self.__idxs, self.__typs))
+    @property
+    def single(self):
+        """
+        Whether this gets a single column rather than a tuple of columns
+        """
+        return self.__single
+    def __call__(self, data):
+        values = tuple(_index(data, idx, typ) for idx, typ in zip(self.__idxs, self.__typs))
+        return values[0] if self.__single else values
+    def map_batch(self, lines):
+        """
+        Gets the columns of each of the given lines
+        """
+        if self.__single:
+            [idx], [typ] = self.__idxs, self.__typs
+            values = list(map(itemgetter(idx), lines))
+            return values if typ is None else list(map(typ, values))
+        if any(typ is not None for typ in self.__typs):
+            return [self(line) for line in lines]
+        if len(self.__idxs) == 1:
+            [idx] = self.__idxs
+            return [(line[idx],) for line in lines]
+        return list(map(itemgetter(*self.__idxs), lines))
+
+def col(idx, typ=None):
     """
     Get the idx'th column of the underlying data
     """
-    return lambda data: _index(data, (idx, typ))
+    return _Columns([(idx, typ)], single=True)
 
 def cols(*idx_types):
     """
@@ -17,10 +58,9 @@ def cols(*idx_types):
     For example,
         cols(0, (2, int)) == lambda x: (x[0], int(x[2]))
     """
-    return lambda data: tuple(_index(data, idx_type) for idx_type in idx_types)
+    return _Columns(idx_types, single=False)
 
-def _index(data, idx_type):
-    if isinstance(idx_type, tuple):
-        idx, typ = idx_type
-        return typ(data[idx])
-    return data[idx_type]
+def _index(data, idx, typ):
+    if typ is None:
+        return data[idx]
+    return typ(data[idx])
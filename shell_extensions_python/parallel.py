@@ -0,0 +1,173 @@
+"""
+Runs several pipelines at once, with a bounded number running at any time.
+"""
+
+import os
+import queue
+from functools import reduce
+from threading import Event, Lock, Thread
+
+from .pipeline import Pipeline
+from .pipeline_result import PipelineResult
+from .run_shell_commands import s, se
+from .shell_types import NoNewline
+
+COMBINERS = {
+    '|': lambda x, y: x | y,
+    '&': lambda x, y: x & y,
+    '+': lambda x, y: x + y,
+}
+
+class _WorkerDone:
+    """
+    Sent by a worker thread once it has no more commands to run
+    """
+    def __init__(self, exception=None):
+        self.exception = exception
+
+class ParallelPipeline(Pipeline):
+    """
+    A pipeline made of the interleaved outputs of several commands, see `parallel`
+    """
+    def __init__(self, commands, jobs, combine, fail_fast, tag):
+        super().__init__()
+        if combine not in COMBINERS:
+            raise RuntimeError("combine should be one of %s but was %r" % (", ".join(COMBINERS), combine))
+        if jobs is not None and jobs < 1:
+            raise RuntimeError("jobs should be at least 1 but was %s" % jobs)
+        self.__commands = list(commands)
+        self.__jobs = min(jobs or os.cpu_count() or 1, max(len(self.__commands), 1))
+        self.__combine = COMBINERS[combine]
+        self.__fail_fast = fail_fast
+        self.__tag = tag
+        self.__exitcodes = [None] * len(self.__commands)
+        self.__running = {}
+        self.__lock = Lock()
+        self.__cancelled = Event()
+        self.__closed = Event()
+    def _lines(self):
+        pending = queue.Queue()
+        for index in range(len(self.__commands)):
+            pending.put(index)
+        output = queue.Queue(maxsize=1024)
+        for _ in range(self.__jobs):
+            Thread(target=self.__worker, args=[pending, output], daemon=True).start()
+        workers_remaining = self.__jobs
+        failure = None
+        try:
+            while workers_remaining:
+                item = output.get()
+                if isinstance(item, _WorkerDone):
+                    workers_remaining -= 1
+                    if item.exception is not None:
+                        failure = item.exception
+                        self.__cancel()
+                    continue
+                yield item
+        finally:
+            if workers_remaining:
+                # the consumer stopped early: stop the commands, dropping their output
+                self.__closed.set()
+                self.__cancel()
+                while workers_remaining:
+                    if isinstance(output.get(), _WorkerDone):
+                        workers_remaining -= 1
+        if failure is not None:
+            raise failure
+    def _end(self):
+        results = [PipelineResult([], [], code) for code in self.__exitcodes if code is not None]
+        if not results:
+            return 0
+        return reduce(self.__combine, results).returncode
+    def __worker(self, pending, output):
+        exception = None
+        try:
+            while not self.__cancelled.is_set():
+                try:
+                    index = pending.get_nowait()
+                except queue.Empty:
+                    break
+                self.__run(index, output)
+        except BaseException as e: # pylint: disable=broad-except
+            exception = e
+        output.put(_WorkerDone(exception))
+    def __run(self, index, output):
+        pipeline = self.__start(self.__commands[index])
+        with self.__lock:
+            if self.__cancelled.is_set():
+                return
+            self.__running[index] = pipeline
+        label = self.__label(index)
+        # pylint: disable=protected-access
+        lines = pipeline._lines()
+        for fd, line in lines:
+            if self.__closed.is_set():
+                lines.close()
+                break
+            output.put((fd, self.__tagged(label, line)))
+        exitcode = pipeline._end()
+        with self.__lock:
+            del self.__running[index]
+            if not self.__closed.is_set():
+                self.__exitcodes[index] = exitcode
+        if exitcode != 0 and self.__fail_fast:
+            self.__cancel()
+    def __cancel(self):
+        """
+        Stops any more commands from starting, and terminates the ones that are running
+        """
+        self.__cancelled.set()
+        with self.__lock:
+            running = list(self.__running.values())
+        for pipeline in running:
+            pipeline.terminate()
+    def terminate(self):
+        self.__cancel()
+    @staticmethod
+    def __start(command):
+        if isinstance(command, str):
+            return s(command)
+        if isinstance(command, (tuple, list)):
+            return se(*command)
+        if callable(command):
+            pipeline = command()
+            if not isinstance(pipeline, Pipeline):
+                raise RuntimeError("Command function should return a Pipeline but returned %s" % type(pipeline))
+            return pipeline
+        raise RuntimeError("Invalid command %r: should be a str, tuple, or function returning a Pipeline" % (command,))
+    def __label(self, index):
+        command = self.__commands[index]
+        if isinstance(command, str):
+            return command
+        if isinstance(command, (tuple, list)):
+            return " ".join(command)
+        return str(index)
+    def __tagged(self, label, line):
+        if not self.__tag:
+            return line
+        if isinstance(line, bytes):
+            return label.encode('utf-8') + b"\t" + line
+        if isinstance(line, NoNewline):
+            return NoNewline(label + "\t" + line)
+        if isinstance(line, str):
+            return label + "\t" + line
+        return line
+
+def parallel(commands, jobs=None, combine='&', fail_fast=False, tag=True):
+    """
+    Runs the given commands concurrently, at most `jobs` at a time (by default, one per CPU), and
+        returns a pipeline of their interleaved outputs.
+
+    commands: each is either a string (run with `s`), a tuple of strings (run with `se`), or a
+        function of no arguments that returns a Pipeline
+    combine: how to combine the exit codes, in the order of the commands, following the rules of
+        the `|`, `&`, and `+` operators on PipelineResult
+    fail_fast: once a command fails, terminate the running commands and do not start any more
+    tag: prefix each line with the command that produced it and a tab, like GNU parallel's --tag
+
+    If the consumer stops early, e.g., because of `head`, the running commands are terminated and
+        the exit code only combines those of the commands that completed before then
+
+    For example, `parallel([('make', '-C', d) for d in dirs], jobs=4) > Collect`
+    """
+    return ParallelPipeline(commands, jobs, combine, fail_fast, tag)
@@ -5,7 +5,7 @@ Pipelines are iterables with an interleaved standard out and standard error, whi
 
 from abc import ABCMeta, abstractmethod
 from .pipeline_result import PipelineResult
-from .pipeline_map import PipelineMap, LineMap
+from .pipeline_map import fuse, to_pipeline_map, unbatch
 from .fd import FD
 
 # TODO add way to flush streams
@@ -33,9 +33,33 @@ class Pipeline(metaclass=ABCMeta):
         Only to be called once _lines is exhausted
         """
         pass
+    def _batches(self):
+        """
+        Yields several (FD, list of lines) batches, each a run of lines on one file descriptor, which
+            together contain the same lines as _lines. Pipelines that produce several lines at
+            once should override this so that batched maps can process them together, see
+            PipelineMap.map_batch. By default, yields batches of one line
+        """
+        lines = self._lines()
+        try:
+            for fd, line in lines:
+                yield fd, [line]
+        finally:
+            lines.close()
     def __iter__(self):
         yield from self._lines()
         self._exitcode = self._end()
+    def batches(self):
+        """
+        Iterates over this pipeline as (FD, list of lines) batches, see _batches
+        """
+        yield from self._batches()
+        self._exitcode = self._end()
+    def terminate(self):
+        """
+        Terminates any processes this pipeline runs, so that it finishes early. Does nothing for
+            pipelines that do not run processes
+        """
     @property
     def exitcode(self):
         """
@@ -81,20 +105,19 @@ class Pipeline(metaclass=ABCMeta):
     def _map(self, mapper, fds):
         """
         Map the given mapper over this pipeline. If the mapper is just a function, map over fds
+
+        If the mapper is itself a pipeline, defers to its reflected operator, e.g., Process.__ror__
         """
-        if isinstance(mapper, PipelineMap):
-            return MappedPipeline(self, mapper)
-        elif isinstance(mapper, type) and issubclass(mapper, PipelineMap):
-            return MappedPipeline(self, mapper(fds))
-        elif callable(mapper):
-            return MappedPipeline(self, LineMap(mapper, fds))
-        else:
-            raise RuntimeError("Invalid mapping object, should be a "
-                               + "PipelineMap or callable but was %s" % type(mapper))
+        if isinstance(mapper, Pipeline):
+            return NotImplemented
+        return MappedPipeline(self, to_pipeline_map(mapper, fds))
 
 class MappedPipeline(Pipeline):
     """
     Represents the result of a map operation
+
+    If the mapper stops consuming its input early, like `head`, the underlying pipeline is closed
+        straight away, which terminates any processes it runs
     """
     def __init__(self, pipeline, mapper):
         super().__init__()
@@ -102,7 +125,35 @@ class MappedPipeline(Pipeline):
         self.__mapper = mapper
     def _lines(self):
         # pylint: disable=W0212
-        yield from self.__mapper.map(self.__pipeline._lines())
+        if self.__mapper.batched:
+            yield from unbatch(self._batches())
+            return
+        lines = self.__pipeline._lines()
+        try:
+            yield from self.__mapper.map(lines)
+        finally:
+            lines.close()
+    def _batches(self):
+        # pylint: disable=W0212
+        batches = self.__pipeline._batches()
+        try:
+            yield from self.__mapper.map_batch(batches)
+        finally:
+            batches.close()
     def _end(self):
         # pylint: disable=W0212
         return self.__pipeline._end()
+    def terminate(self):
+        self.__pipeline.terminate()
+    def _map(self, mapper, fds):
+        """
+        Maps the given mapper over this pipeline, fusing it with this pipeline's mapper if possible,
+            so that a chain of line maps and filters runs as a single loop, see pipeline_map.fuse
+        """
+        if isinstance(mapper, Pipeline):
+            return NotImplemented
+        mapper = to_pipeline_map(mapper, fds)
+        fused = fuse(self.__mapper, mapper)
+        if fused is None:
+            return MappedPipeline(self, mapper)
+        return MappedPipeline(self.__pipeline, fused)
@@ -3,6 +3,7 @@ Classes for consuming pipelines, and then returning the standard out and standar
 """
 
 from abc import ABCMeta, abstractmethod
+from codecs import getincrementaldecoder
 
 from .colors import PrintColors
 from .fd import FD
@@ -31,19 +32,27 @@ class PipelineConsumer(metaclass=ABCMeta):
 class Terminal(PipelineConsumer): # pragma: no cover
     """
     Prints standard out and standard error to the screen.
+
+    Bytes are decoded incrementally per descriptor, so characters split between blocks of output
+        are printed correctly. A truncated character at the end of the output raises
+        UnicodeDecodeError once the pipeline is complete
     """
-    @staticmethod
-    def consume(fd, line):
-        line = decode_line(line)
+    def __init__(self):
+        self.decoders = {fd: getincrementaldecoder('utf-8')() for fd in FD}
+    def consume(self, fd, line):
+        if isinstance(line, (bytes, bytearray, memoryview)):
+            line = self.decoders[fd].decode(line)
+        else:
+            line = decode_line(line)
         if fd == FD.stdout:
             print(line, end="")
         elif fd == FD.stderr:
             print(PrintColors.red + line + PrintColors.reset, end="")
-    @staticmethod
-    def stdout():
+    def stdout(self):
+        self.decoders[FD.stdout].decode(b"", final=True)
         return []
-    @staticmethod
-    def stderr():
+    def stderr(self):
+        self.decoders[FD.stderr].decode(b"", final=True)
         return []
 
 class Collect(PipelineConsumer):
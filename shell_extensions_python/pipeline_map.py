@@ -2,20 +2,95 @@
 Tools for mapping over pipelines
 """
 
+import heapq
+import os
+import pickle
+import random
+import sys
+import tempfile
 from abc import ABCMeta, abstractmethod
+from collections import deque
+from itertools import groupby
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from .async_bridge import iterate_in_thread
+from .fd import FD
+
+SPILL_BLOCK = 1024
 
 class PipelineMap(metaclass=ABCMeta):
     """
     A map over a pipeline's stdout/stderr stream
+
+    Maps that can work on whole batches of lines at once, e.g., with a list comprehension, set
+        `batched` and implement `map_batch`, which is then used instead of `map`
     """
+    batched = False
     @abstractmethod
     def map(self, pipeline_stream): # pragma: no cover
         """
         Map over pipeline streams
         """
         pass
+    def amap(self, pipeline_stream):
+        """
+        Map over asynchronous pipeline streams. By default, runs `map` in a separate thread, so
+            mappers that are commonly used asynchronously should override this
+        """
+        return iterate_in_thread(self.map, pipeline_stream)
+    def map_batch(self, batches):
+        """
+        Map over a stream of batches, each an (FD, list of lines) pair, see Pipeline._batches.
+            By default, runs `map` over the lines, yielding batches of one line each
+        """
+        for fd, line in self.map(unbatch(batches)):
+            yield fd, [line]
+
+def unbatch(batches):
+    """
+    Yields the (FD, line) pairs in the given (FD, list of lines) batches, closing them after
+    """
+    try:
+        for fd, lines in batches:
+            for line in lines:
+                yield fd, line
+    finally:
+        close = getattr(batches, 'close', None)
+        if close is not None:
+            close()
+
+def rebatch(pairs, size=SPILL_BLOCK):
+    """
+    Groups consecutive (FD, line) pairs on the same FD into batches of at most `size` lines
+    """
+    for fd, group in groupby(pairs, key=lambda pair: pair[0]):
+        lines = [line for _, line in group]
+        for start in range(0, len(lines), size):
+            yield fd, lines[start:start + size]
+
+def _batch_function(func):
+    """
+    Returns a function mapping func over a list of lines, using func.map_batch if it has one
+    """
+    map_batch = getattr(func, 'map_batch', None)
+    if map_batch is not None:
+        return map_batch
+    return lambda lines: [func(line) for line in lines]
+
+class FusableMap(PipelineMap):
+    """
+    A map made of per-line stages, each either mapping or filtering the lines on some file
+        descriptors. Consecutive fusable maps are fused into a single FusedMap, see `fuse`
+    """
+    @abstractmethod
+    def stages(self): # pragma: no cover
+        """
+        Returns a list of (is_filter, func, fds), which maps func over the lines on fds, or, if
+            is_filter, only keeps the lines on fds for which func is true
+        """
+        pass
 
-class LineMap(PipelineMap):
+class LineMap(FusableMap):
     """
     Represents a mapping over individual lines
         fds: which file descriptors to consider
@@ -23,59 +98,485 @@ class LineMap(PipelineMap):
     def __init__(self, func, fds):
         self.__func = func
         self.__fds = fds
+    batched = True
+    def stages(self):
+        return [(False, self.__func, self.__fds)]
     def map(self, pipeline_stream):
         for fd, line in pipeline_stream:
             if fd in self.__fds:
                 yield fd, self.__func(line)
             else:
                 yield fd, line
+    def map_batch(self, batches):
+        func = _batch_function(self.__func)
+        for fd, lines in batches:
+            yield fd, func(lines) if fd in self.__fds else lines
+    async def amap(self, pipeline_stream):
+        async for fd, line in pipeline_stream:
+            if fd in self.__fds:
+                yield fd, self.__func(line)
+            else:
+                yield fd, line
 
-def sort(key=lambda x: x):
+class FilterMap(FusableMap):
+    """
+    Represents a filter over individual lines, keeping those for which filter_fn is true
+        fds: which file descriptors to consider
+    """
+    def __init__(self, filter_fn, fds):
+        self.__filter_fn = filter_fn
+        self.__fds = fds
+    batched = True
+    def stages(self):
+        return [(True, self.__filter_fn, self.__fds)]
+    def map(self, pipeline_stream):
+        for fd, line in pipeline_stream:
+            if fd not in self.__fds or self.__filter_fn(line):
+                yield fd, line
+    def map_batch(self, batches):
+        for fd, lines in batches:
+            if fd in self.__fds:
+                lines = [line for line in lines if self.__filter_fn(line)]
+            if lines:
+                yield fd, lines
+    async def amap(self, pipeline_stream):
+        async for fd, line in pipeline_stream:
+            if fd not in self.__fds or self.__filter_fn(line):
+                yield fd, line
+
+class FusedMap(FusableMap):
+    """
+    Several map and filter stages applied in a single loop, rather than one generator per stage.
+        The stages that apply to each file descriptor are worked out once, up front. With batches,
+        each stage is applied to the whole batch in turn
+    """
+    batched = True
+    def __init__(self, stages):
+        self.__stages = stages
+        self.__by_fd = {fd: [(is_filter, func) for is_filter, func, fds in stages if fd in fds]
+                        for fd in FD}
+        self.__batch_by_fd = {fd: [(is_filter, func if is_filter else _batch_function(func))
+                                   for is_filter, func in fd_stages]
+                              for fd, fd_stages in self.__by_fd.items()}
+    def stages(self):
+        return self.__stages
+    def map(self, pipeline_stream):
+        by_fd = self.__by_fd
+        for fd, line in pipeline_stream:
+            for is_filter, func in by_fd[fd]:
+                if not is_filter:
+                    line = func(line)
+                elif not func(line):
+                    break
+            else:
+                yield fd, line
+    async def amap(self, pipeline_stream):
+        by_fd = self.__by_fd
+        async for fd, line in pipeline_stream:
+            for is_filter, func in by_fd[fd]:
+                if not is_filter:
+                    line = func(line)
+                elif not func(line):
+                    break
+            else:
+                yield fd, line
+    def map_batch(self, batches):
+        batch_by_fd = self.__batch_by_fd
+        for fd, lines in batches:
+            for is_filter, func in batch_by_fd[fd]:
+                if is_filter:
+                    lines = [line for line in lines if func(line)]
+                else:
+                    lines = func(lines)
+                if not lines:
+                    break
+            else:
+                yield fd, lines
+
+def fuse(first, second):
+    """
+    Returns a single map equivalent to applying first and then second, or None if they cannot be fused
+    """
+    if isinstance(first, FusableMap) and isinstance(second, FusableMap):
+        return FusedMap(first.stages() + second.stages())
+    return None
+
+class ParallelLineMap(PipelineMap):
+    """
+    Represents a mapping over individual lines, run in a pool of `workers` processes (by default,
+        one per CPU). The lines on `fds` are sent to the workers in chunks of `chunksize`, and
+        lines on other descriptors are passed through straight away.
+
+    If `ordered`, the mapped lines are yielded in their original order, otherwise each chunk is
+        yielded as soon as it is done. `func` must be picklable, e.g., a function defined at the
+        top level of a module, and not a lambda
+    """
+    def __init__(self, func, fds, workers=None, chunksize=256, ordered=True):
+        if chunksize < 1:
+            raise ValueError("chunksize should be at least 1 but was %s" % chunksize)
+        self.__func = func
+        self.__fds = fds
+        self.__workers = workers
+        self.__chunksize = chunksize
+        self.__ordered = ordered
+    def map(self, pipeline_stream):
+        workers = self.__workers or os.cpu_count() or 1
+        executor = ProcessPoolExecutor(workers)
+        # enough chunks in flight to keep every worker busy, without reading the whole stream
+        max_pending = 2 * workers
+        pending = deque()
+        chunk = []
+        try:
+            for fd, line in pipeline_stream:
+                if fd not in self.__fds:
+                    yield fd, line
+                    continue
+                chunk.append((fd, line))
+                if len(chunk) < self.__chunksize:
+                    continue
+                pending.append(self.__submit(executor, chunk))
+                chunk = []
+                while len(pending) >= max_pending:
+                    yield from self.__next_done(pending)
+            if chunk:
+                pending.append(self.__submit(executor, chunk))
+            while pending:
+                yield from self.__next_done(pending)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+    def __submit(self, executor, chunk):
+        fds = [fd for fd, _ in chunk]
+        return fds, executor.submit(_map_chunk, self.__func, [line for _, line in chunk])
+    def __next_done(self, pending):
+        """
+        Removes a finished chunk from pending, waiting for one if necessary, and yields its lines
+        """
+        if self.__ordered:
+            fds, future = pending.popleft()
+        else:
+            done, _ = wait([future for _, future in pending], return_when=FIRST_COMPLETED)
+            fds, future = next(item for item in pending if item[1] in done)
+            pending.remove((fds, future))
+        yield from zip(fds, future.result())
+
+def _map_chunk(func, lines):
+    """
+    Maps func over a chunk of lines, in a worker process of ParallelLineMap
+    """
+    return [func(line) for line in lines]
+
+class BufferedMap(PipelineMap):
+    """
+    A map that keeps some state, such as a buffer of recent lines, across the lines on the given
+        file descriptors. Lines on other descriptors are passed through straight away.
+
+    Subclasses implement `start`, which resets the state at the start of a stream, `feed`, which
+        takes an (FD, line) pair and returns the pairs to yield, and optionally `finish`, which
+        returns the pairs to yield once the stream ends
+    """
+    def __init__(self, fds):
+        self.fds = fds
+    @abstractmethod
+    def start(self): # pragma: no cover
+        """
+        Resets the state before a stream is mapped over
+        """
+        pass
+    @abstractmethod
+    def feed(self, fd, line): # pragma: no cover
+        """
+        Returns the (FD, line) pairs to yield after seeing the given line
+        """
+        pass
+    def finish(self):
+        """
+        Returns the (FD, line) pairs to yield once the stream ends
+        """
+        return ()
+    def map(self, pipeline_stream):
+        self.start()
+        for fd, line in pipeline_stream:
+            if fd in self.fds:
+                yield from self.feed(fd, line)
+            else:
+                yield fd, line
+        yield from self.finish()
+    async def amap(self, pipeline_stream):
+        self.start()
+        async for fd, line in pipeline_stream:
+            if fd in self.fds:
+                for item in self.feed(fd, line):
+                    yield item
+            else:
+                yield fd, line
+        for item in self.finish():
+            yield item
+
+def to_pipeline_map(mapper, fds):
+    """
+    Converts the given mapper to a PipelineMap. If the mapper is just a function, map over fds
+    """
+    if isinstance(mapper, PipelineMap):
+        return mapper
+    elif isinstance(mapper, type) and issubclass(mapper, PipelineMap):
+        return mapper(fds)
+    elif callable(mapper):
+        return LineMap(mapper, fds)
+    else:
+        raise RuntimeError("Invalid mapping object, should be a "
+                           + "PipelineMap or callable but was %s" % type(mapper))
+
+def sort(key=lambda x: x, reverse=False, unique=False, numeric=False, memory=None):
     """
     Sorts the contents using the natural order specified by `key`
+
+    reverse: sort in descending order
+    unique: only keep the first of the lines with equal keys, like sort -u
+    numeric: compare the keys as numbers, like sort -n. Keys that are not numbers compare as 0
+    memory: the approximate number of bytes of lines to hold in memory, or None for no limit. Once
+        it is exceeded, the lines are sorted and spilled to a temporary file, and the files are
+        merged at the end
     """
+    sort_key = _numeric(key) if numeric else key
     class _Sort(PipelineMap):
+        batched = True
         def __init__(self, fds):
             self.__fds = fds
         def map(self, pipeline_stream):
-            to_sort = []
+            runs = _SortedRuns(sort_key, reverse, memory)
             for fd, line in pipeline_stream:
                 if fd in self.__fds:
-                    to_sort.append((fd, line))
+                    runs.add(fd, line)
                 else:
                     yield fd, line
-            for fd, line in sorted(to_sort, key=lambda fd_line: key(fd_line[1])):
+            yield from self.__sorted(runs)
+        def map_batch(self, batches):
+            runs = _SortedRuns(sort_key, reverse, memory)
+            for fd, lines in batches:
+                if fd in self.__fds:
+                    for line in lines:
+                        runs.add(fd, line)
+                else:
+                    yield fd, lines
+            yield from rebatch(self.__sorted(runs))
+        async def amap(self, pipeline_stream):
+            runs = _SortedRuns(sort_key, reverse, memory)
+            async for fd, line in pipeline_stream:
+                if fd in self.__fds:
+                    runs.add(fd, line)
+                else:
+                    yield fd, line
+            for fd, line in self.__sorted(runs):
                 yield fd, line
+        @staticmethod
+        def __sorted(runs):
+            if not unique:
+                return runs.merged()
+            return _unique(runs.merged(), sort_key)
     return _Sort
 
+def _numeric(key):
+    """
+    Converts the given key to a number, or 0 if it is not one
+    """
+    def numeric_key(line):
+        try:
+            return float(key(line))
+        except (TypeError, ValueError):
+            return 0
+    return numeric_key
+
+def _unique(stream, key):
+    """
+    Yields the first of each run of lines with equal keys
+    """
+    first, previous = True, None
+    for fd, line in stream:
+        current = key(line)
+        if first or current != previous:
+            yield fd, line
+        first, previous = False, current
+
+class _SortedRuns:
+    """
+    Collects (FD, line) pairs to be sorted. Once the lines take up more than `memory` bytes, they
+        are sorted and pickled to a temporary file in blocks of SPILL_BLOCK lines
+
+    Lines that are memoryviews, e.g., of a memory mapped cat, are stored as bytes, since views can
+        neither be compared nor pickled
+    """
+    def __init__(self, key, reverse, memory):
+        self.__key = lambda fd_line: key(fd_line[1])
+        self.__reverse = reverse
+        self.__memory = memory
+        self.__lines = []
+        self.__size = 0
+        self.__runs = []
+    def add(self, fd, line):
+        """
+        Adds a line, spilling the lines to disk if they are over the memory limit
+        """
+        if isinstance(line, memoryview):
+            line = line.tobytes()
+        self.__lines.append((fd, line))
+        if self.__memory is not None:
+            self.__size += sys.getsizeof(line)
+            if self.__size > self.__memory:
+                self.__spill()
+    def __spill(self):
+        self.__lines.sort(key=self.__key, reverse=self.__reverse)
+        run = tempfile.TemporaryFile()
+        for start in range(0, len(self.__lines), SPILL_BLOCK):
+            pickle.dump(self.__lines[start:start + SPILL_BLOCK], run, pickle.HIGHEST_PROTOCOL)
+        run.seek(0)
+        self.__runs.append(run)
+        self.__lines = []
+        self.__size = 0
+    def merged(self):
+        """
+        Yields all the lines in sorted order, merging the spilled runs with the ones in memory
+        """
+        self.__lines.sort(key=self.__key, reverse=self.__reverse)
+        try:
+            if not self.__runs:
+                yield from self.__lines
+            else:
+                runs = [_read_run(run) for run in self.__runs] + [self.__lines]
+                yield from heapq.merge(*runs, key=self.__key, reverse=self.__reverse)
+        finally:
+            for run in self.__runs:
+                run.close()
+
+def _read_run(run):
+    """
+    Yields the lines of a run spilled by _SortedRuns
+    """
+    while True:
+        try:
+            block = pickle.load(run)
+        except EOFError:
+            return
+        yield from block
+
 def head(count):
     """
     Gets the first `count` elements from a stream
+
+    Once they have been seen, the upstream pipeline is closed, so that any processes it runs are
+        terminated, and no further lines on any descriptor are produced
     """
     class _Head(PipelineMap):
+        batched = True
         def __init__(self, fds):
             self.__fds = fds
         def map(self, pipeline_stream):
+            if count <= 0:
+                return
             current_count = 0
-            continue_yielding = True
             for fd, line in pipeline_stream:
-                if current_count >= count:
-                    continue_yielding = False
-                if continue_yielding or fd not in self.__fds:
-                    yield fd, line
+                yield fd, line
                 if fd in self.__fds:
                     current_count += 1
+                    if current_count >= count:
+                        return
+        def map_batch(self, batches):
+            if count <= 0:
+                return
+            remaining = count
+            for fd, lines in batches:
+                if fd not in self.__fds:
+                    yield fd, lines
+                elif len(lines) < remaining:
+                    remaining -= len(lines)
+                    yield fd, lines
+                else:
+                    yield fd, lines[:remaining]
+                    return
+        async def amap(self, pipeline_stream):
+            if count <= 0:
+                return
+            current_count = 0
+            async for fd, line in pipeline_stream:
+                yield fd, line
+                if fd in self.__fds:
+                    current_count += 1
+                    if current_count >= count:
+                        return
     return _Head
 
 def retain(filter_fn):
     """
     Retains only the elements matching filter_fn
     """
-    class _Retain(PipelineMap):
+    class _Retain(FilterMap):
         def __init__(self, fds):
-            self.__fds = fds
-        def map(self, pipeline_stream):
-            for fd, line in pipeline_stream:
-                if fd not in self.__fds or filter_fn(line):
-                    yield fd, line
+            super().__init__(filter_fn, fds)
     return _Retain
+
+def tail(count):
+    """
+    Gets the last `count` elements from a stream, keeping only those in memory
+    """
+    class _Tail(BufferedMap):
+        def start(self):
+            self.__lines = deque(maxlen=count)
+        def feed(self, fd, line):
+            self.__lines.append((fd, line))
+            return ()
+        def finish(self):
+            return self.__lines
+    return _Tail
+
+def window(size):
+    """
+    Replaces each element, once `size` have been seen, with a tuple of the last `size` elements,
+        ending in it. Fewer than `size` elements produce no windows
+    """
+    class _Window(BufferedMap):
+        def start(self):
+            self.__lines = deque(maxlen=size)
+        def feed(self, fd, line):
+            self.__lines.append(line)
+            if len(self.__lines) < size:
+                return ()
+            return [(fd, tuple(self.__lines))]
+    return _Window
+
+def dedupe_adjacent(key=lambda x: x):
+    """
+    Removes elements whose `key` is equal to that of the element before them, like uniq
+    """
+    class _DedupeAdjacent(BufferedMap):
+        def start(self):
+            self.__previous = []
+        def feed(self, fd, line):
+            current = key(line)
+            if self.__previous and self.__previous[0] == current:
+                return ()
+            self.__previous = [current]
+            return [(fd, line)]
+    return _DedupeAdjacent
+
+def sample(rate, seed=None):
+    """
+    Keeps each element with probability `rate`. Set `seed` to make the sample reproducible
+    """
+    if not 0 <= rate <= 1:
+        raise ValueError("rate should be between 0 and 1 but was %s" % rate)
+    class _Sample(BufferedMap):
+        def start(self):
+            self.__random = random.Random(seed)
+        def feed(self, fd, line):
+            if self.__random.random() < rate:
+                return [(fd, line)]
+            return ()
+    return _Sample
+
+def pmap(func, workers=None, chunksize=256, ordered=True):
+    """
+    Maps `func` over each element, in a pool of processes, see ParallelLineMap
+    """
+    class _PMap(ParallelLineMap):
+        def __init__(self, fds):
+            super().__init__(func, fds, workers=workers, chunksize=chunksize, ordered=ordered)
+    return _PMap
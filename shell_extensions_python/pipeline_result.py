@@ -2,14 +2,24 @@
 Represents the result of a pipeline, which contains a recorded standard output, standard error,
     and exit code. Can be combined in a variety of ways or converted into a boolean success code.
 """
+from itertools import groupby
 from os import linesep
 from .shell_types import decode_line
 
 def concatenate_all_to_string(items):
     """
-    Concatenate a list of strings or bytes objects to a string, possibly utf-8 encoding it
+    Concatenate a list of strings or bytes objects to a string, possibly utf-8 encoding it.
+
+    Consecutive bytes objects are joined before being decoded, so that characters split between
+        blocks of output are decoded correctly
     """
-    return "".join(map(decode_line, items))
+    result = []
+    for is_bytes, group in groupby(items, key=lambda item: isinstance(item, (bytes, bytearray, memoryview))):
+        if is_bytes:
+            result.append(b"".join(group).decode('utf-8'))
+        else:
+            result.extend(map(decode_line, group))
+    return "".join(result)
 
 class PipelineResult:
     """
@@ -0,0 +1,113 @@
+"""
+Readers that turn the output pipes of a process into a single stream of (FD, line) pairs.
+
+Each reader takes a list of (FD, file) pairs and yields the lines of the files, as bytes that
+    include their trailing newline, in the order they arrive. If a chunk_size is given, it instead
+    yields blocks of at most that many bytes, as soon as they are available.
+
+The lines are yielded in batches: lists of (FD, line) pairs, each containing every line that was
+    available at once.
+"""
+
+import os
+import selectors
+import sys
+from itertools import groupby
+
+from .tcombinator import TCombinator
+
+READ_SIZE = 1 << 16
+
+def chunk_size(chunks):
+    """
+    Converts a `chunks` argument to a block size: None for False, READ_SIZE for True
+    """
+    if chunks is True:
+        return READ_SIZE
+    if not chunks:
+        return None
+    if not isinstance(chunks, int) or chunks < 1:
+        raise ValueError("chunks should be True, False, or a positive size but was %s" % chunks)
+    return chunks
+
+class LineSplitter:
+    """
+    Splits a sequence of blocks of bytes into lines, keeping the newline at the end of each line
+    """
+    def __init__(self):
+        self.__partial = []
+    def feed(self, block):
+        """
+        Returns the list of lines completed by the given block
+        """
+        end = block.rfind(b"\n")
+        if end == -1:
+            self.__partial.append(block)
+            return []
+        if self.__partial:
+            self.__partial.append(block[:end])
+            complete = b"".join(self.__partial)
+        else:
+            complete = block[:end]
+        rest = block[end + 1:]
+        self.__partial = [rest] if rest else []
+        return [line + b"\n" for line in complete.split(b"\n")]
+    def finish(self):
+        """
+        Returns the final line if it did not end in a newline
+        """
+        rest = b"".join(self.__partial)
+        self.__partial = []
+        return [rest] if rest else []
+
+def thread_reader(streams, chunk_size=None):
+    """
+    Reads each stream in its own thread
+    """
+    return TCombinator(*(_tagged(fd, stream, chunk_size) for fd, stream in streams)).batches()
+
+def _tagged(fd, stream, chunk_size):
+    lines = stream
+    if chunk_size is not None:
+        lines = iter(lambda: stream.read1(chunk_size), b"")
+    for line in lines:
+        yield fd, line
+
+def selector_reader(streams, chunk_size=None):
+    """
+    Reads all the streams from the calling thread, waiting on them with a selector
+    """
+    selector = selectors.DefaultSelector()
+    for fd, stream in streams:
+        selector.register(stream.fileno(), selectors.EVENT_READ, (fd, LineSplitter()))
+    try:
+        while selector.get_map():
+            for key, _ in selector.select():
+                fd, splitter = key.data
+                block = os.read(key.fd, chunk_size or READ_SIZE)
+                if not block:
+                    selector.unregister(key.fd)
+                if chunk_size is not None:
+                    lines = [block] if block else []
+                elif block:
+                    lines = splitter.feed(block)
+                else:
+                    lines = splitter.finish()
+                if lines:
+                    yield [(fd, line) for line in lines]
+    finally:
+        selector.close()
+
+def group_by_fd(batches):
+    """
+    Converts the batches yielded by a reader to pipeline batches, see Pipeline._batches: each run of
+        consecutive lines on the same FD becomes an (FD, list of lines) pair
+    """
+    try:
+        for batch in batches:
+            for fd, pairs in groupby(batch, key=lambda pair: pair[0]):
+                yield fd, [line for _, line in pairs]
+    finally:
+        batches.close()
+
+DEFAULT_READER = selector_reader if sys.platform.startswith('linux') else thread_reader
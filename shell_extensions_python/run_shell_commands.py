@@ -2,14 +2,23 @@
 Various functions to help run shell commands.
 """
 
+import mmap
+import os
+import signal
 import subprocess
+import sys
+from threading import RLock
 
 from .fd import FD
 from .pipeline import Pipeline
 from .path_manipulation import expand_user
-from .shell_types import NoNewline
+from .pipeline_map import unbatch
+from .process_readers import DEFAULT_READER, READ_SIZE, chunk_size, group_by_fd
+from .shell_types import NoNewline, decode_line
 from .tcombinator import TCombinator
 
+CANCELLED_EXITCODES = {-signal.SIGTERM, -signal.SIGPIPE}
+
 class ProcessFailedException(RuntimeError):
     """
     An exception representing a failed process
@@ -19,26 +28,289 @@ class ProcessFailedException(RuntimeError):
 class Process(Pipeline):
     """
     A pipeline created by the standard out and error of a process
+
+    The process is started the first time the pipeline is consumed or `proc` is accessed, so that
+        it can first be connected to other processes with `|`, see ProcessChain.
+
+    reader: how to read the output pipes, see process_readers. Defaults to DEFAULT_READER
+    chunks: if set, yield blocks of bytes as they arrive instead of lines. True for blocks of up to
+        process_readers.READ_SIZE bytes, or the maximum block size
+    stdin: an iterable of lines or a pipeline whose stdout is written to the process's stdin by a
+        background thread. The stderr of a pipeline is passed through, and if the process succeeds
+        the pipeline's exit code is used. A `cat` of a readable file is instead passed to the
+        process as its stdin, so the file is never read by python. See also `__lt__` and `__ror__`
+
+    If the consumer stops reading early, e.g., because of `head`, the process is terminated, and
+        if it is killed by that (or by SIGPIPE), its exit code is 0, as it would be for
+        `a | head` in bash
     """
-    def __init__(self, proc, print_direct, raw_bytes):
+    def __init__(self, command, shell, print_direct, raw_bytes, reader=None, stdin=None, chunks=False):
         super().__init__()
-        self.proc = proc
+        self.command = command
+        self.shell = shell
         self.print_direct = print_direct
         self.raw_bytes = raw_bytes
+        self.chunk_size = chunk_size(chunks)
+        self.reader = DEFAULT_READER if reader is None else reader
+        self.stdin = stdin
+        self._stdin_exitcode = 0
+        self.__proc = None
+        self.__terminated = False
+        self.__cancelled = False
+        self.__lock = RLock()
+    @property
+    def proc(self):
+        """
+        The underlying subprocess.Popen object, starting the process if it has not been started
+        """
+        with self.__lock:
+            if self.__proc is None:
+                self._start()
+            return self.__proc
+    @property
+    def started(self):
+        """
+        Whether the process has been started
+        """
+        return self.__proc is not None
+    def _start(self, stdin=None, pipe_stdout=False):
+        """
+        Starts the process reading from stdin. Its stdout is piped if pipe_stdout or not print_direct.
+            Raises an error if the process has already been started, since it would not be connected
+            to stdin as requested
+        """
+        pipe = None if self.print_direct else subprocess.PIPE
+        direct = None
+        if stdin is None and self.stdin is not None:
+            if isinstance(self.stdin, cat):
+                direct = self.stdin._file() # pylint: disable=protected-access
+            stdin = subprocess.PIPE if direct is None else direct
+        with self.__lock:
+            if self.__proc is not None:
+                raise RuntimeError("%s has already been started" % (self.command,))
+            self.__proc = subprocess.Popen(self.command, shell=self.shell, stdin=stdin,
+                                           stdout=subprocess.PIPE if pipe_stdout else pipe, stderr=pipe)
+            if self.__terminated:
+                self.__proc.terminate()
+        if direct is not None:
+            self._stdin_exitcode = self.stdin._end() # pylint: disable=protected-access
+        return self.__proc
+    def terminate(self):
+        """
+        Terminates the process if it is running. If it has not started yet, it is terminated as
+            soon as it starts
+        """
+        with self.__lock:
+            self.__terminated = True
+            if self.__proc is not None and self.__proc.poll() is None:
+                self.__proc.terminate()
+        if isinstance(self.stdin, Pipeline):
+            self.stdin.terminate()
+    def _cancel(self):
+        """
+        Terminates the process because its output is no longer needed
+        """
+        self.__cancelled = True
+        self.terminate()
     def _lines(self):
+        return unbatch(self._batches())
+    def _batches(self):
+        proc = self.proc
+        streams = []
         if not self.print_direct:
-            yield from TCombinator(
-                ((FD.stdout, self.__encode(line)) for line in self.proc.stdout),
-                ((FD.stderr, self.__encode(line)) for line in self.proc.stderr)
-            )
-            self.proc.stdout.close()
-            self.proc.stderr.close()
+            streams = [(FD.stdout, proc.stdout), (FD.stderr, proc.stderr)]
+        yield from group_by_fd(self._read(streams, self._feeder(), self._cancel))
     def _end(self):
-        return self.proc.wait()
+        return self._wait() or self._stdin_exitcode
+    def _wait(self):
+        """
+        Waits for the process to exit and returns its exit code, which is 0 if it was killed
+            because it was cancelled or never started
+        """
+        if not self.started:
+            # the output was closed before it was read, so there is no need to run the process
+            return 0
+        exitcode = self.proc.wait()
+        if self.__cancelled and exitcode in CANCELLED_EXITCODES:
+            return 0
+        return exitcode
+    def _feeder(self):
+        """
+        Returns _feed() if python has to write self.stdin to the started process, otherwise None
+        """
+        if self.stdin is None or self.proc.stdin is None:
+            return None
+        return self._feed()
+    def _read(self, streams, feeder, cancel):
+        """
+        Reads the given (FD, file) pairs with this process's reader and encoding, closing them after,
+            and yields the lists of (FD, line) pairs the reader produces. If a feeder is given, it is
+            run concurrently and the lists it yields are passed through.
+
+        If reading stops before the end, e.g., as the consumer closed this generator, `cancel` is
+            called and then the reader is stopped. The files are closed by the thread running the
+            reader once it stops, since it may still be waiting on them
+        """
+        batches = self.__encoded(streams)
+        if feeder is not None:
+            batches = iter(TCombinator(feeder, batches))
+        completed = False
+        try:
+            yield from batches
+            completed = True
+        finally:
+            if not completed:
+                cancel()
+            batches.close()
+    def __encoded(self, streams):
+        reader = self.reader(streams, self.chunk_size)
+        try:
+            for batch in reader:
+                yield [(fd, self.__encode(line)) for fd, line in batch]
+        finally:
+            close = getattr(reader, 'close', None)
+            if close is not None:
+                close()
+            for _, stream in streams:
+                stream.close()
+    def _feed(self):
+        """
+        Writes the stdout of self.stdin to the process, yielding the stderr, in batches of one line,
+            if it is a pipeline. Stops consuming self.stdin, closing it, if the process closes its
+            stdin or is cancelled, in which case the exit code of self.stdin is ignored
+        """
+        # pylint: disable=protected-access
+        if isinstance(self.stdin, Pipeline):
+            items = self.stdin._lines()
+        else:
+            items = ((FD.stdout, line) for line in self.stdin)
+        completed = False
+        try:
+            for fd, line in items:
+                if self.__cancelled:
+                    break
+                if fd != FD.stdout:
+                    yield [(fd, line)]
+                    continue
+                try:
+                    self.proc.stdin.write(_encode_input(line))
+                except BrokenPipeError:
+                    break
+            else:
+                completed = True
+        finally:
+            try:
+                self.proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            if not completed:
+                # closing a pipeline's lines cancels it, like head does
+                items.close()
+            if isinstance(self.stdin, Pipeline):
+                exitcode = self.stdin._end()
+                self._stdin_exitcode = exitcode if completed else 0
     def __encode(self, line):
-        if self.raw_bytes:
+        if self.raw_bytes or self.chunk_size is not None:
             return line
         return NoNewline(line.decode('utf-8'))
+    def __or__(self, other):
+        """
+        If other is a process, connects this process's stdout to its stdin, see ProcessChain.
+            Otherwise, maps other over this pipeline, see Pipeline.__or__
+        """
+        if isinstance(other, (Process, ProcessChain)):
+            return ProcessChain([self]) | other
+        return super().__or__(other)
+    def __ror__(self, pipeline):
+        """
+        pipeline | self writes the stdout of the pipeline to this process's stdin
+        """
+        return self < pipeline
+    def __lt__(self, source):
+        """
+        self < source writes the lines of source, an iterable or pipeline, to this process's stdin.
+            Due to python's comparison chaining, use (self < source) > consumer rather than
+            self < source > consumer
+        """
+        if self.started:
+            raise RuntimeError("Cannot write to the stdin of %s as it has already started" % (self.command,))
+        if self.stdin is not None:
+            raise RuntimeError("The stdin of %s has already been set" % (self.command,))
+        self.stdin = source
+        return self
+
+class ProcessChain(Pipeline):
+    """
+    Several processes, each of whose stdout is connected to the stdin of the next with an OS pipe,
+        like `a | b | c` in bash. No data passes through python except the final process's stdout
+        and the stderr of all the processes, which are interleaved.
+
+    The exit code is that of the last process to fail, or 0 if none do, like bash's pipefail
+    """
+    def __init__(self, processes):
+        super().__init__()
+        for process in processes:
+            if process.started:
+                raise RuntimeError("Cannot pipe %s as it has already started" % (process.command,))
+        for process in processes[1:]:
+            if process.stdin is not None:
+                raise RuntimeError("Cannot pipe into %s as its stdin has already been set" % (process.command,))
+        self.processes = processes
+    def __or__(self, other):
+        if isinstance(other, Process):
+            return ProcessChain(self.processes + [other])
+        if isinstance(other, ProcessChain):
+            return ProcessChain(self.processes + other.processes)
+        return super().__or__(other)
+    def __ror__(self, pipeline):
+        """
+        pipeline | self writes the stdout of the pipeline to the first process's stdin
+        """
+        # pylint: disable=expression-not-assigned
+        self.processes[0] < pipeline
+        return self
+    def _lines(self):
+        return unbatch(self._batches())
+    def _batches(self):
+        # pylint: disable=protected-access
+        first, *inner, last = self.processes
+        inner = [first] + inner
+        stdin = None
+        streams = []
+        for process in inner:
+            proc = process._start(stdin=stdin, pipe_stdout=True)
+            if stdin is not None:
+                stdin.close()
+            stdin = proc.stdout
+            if not process.print_direct:
+                streams.append((FD.stderr, proc.stderr))
+        proc = last._start(stdin=stdin)
+        if stdin is not None:
+            stdin.close()
+        if not last.print_direct:
+            streams += [(FD.stdout, proc.stdout), (FD.stderr, proc.stderr)]
+        yield from group_by_fd(last._read(streams, first._feeder(), self._cancel))
+    def terminate(self):
+        for process in self.processes:
+            process.terminate()
+    def _cancel(self):
+        # pylint: disable=protected-access
+        for process in self.processes:
+            process._cancel()
+    def _end(self):
+        # pylint: disable=protected-access
+        exitcodes = [self.processes[0]._stdin_exitcode] + [process._wait() for process in self.processes]
+        return next((code for code in reversed(exitcodes) if code != 0), 0)
+
+def _encode_input(line):
+    """
+    Encodes a line to be written to a process's stdin, adding a newline unless it is NoNewline
+    """
+    if isinstance(line, bytes):
+        return line
+    if not isinstance(line, str):
+        line = str(line)
+    return decode_line(line).encode('utf-8')
 
 class cat(Pipeline): # pylint: disable=C0103
     """
@@ -46,11 +318,23 @@ class cat(Pipeline): # pylint: disable=C0103
 
     Return code 0 if successful, 1 if there was an error reading the file (e.g., not found)
         Acts like the unix utility cat
+
+    chunks: if set, yield blocks of bytes rather than lines, see Process
+    memory_map: if set, memory map the file and find the lines by scanning the mapping rather than
+        reading it through a buffer. With raw_bytes or chunks, the lines are memoryviews of the
+        mapping, so no data is copied; they keep the mapping open while they are referenced
+
+    Piping a cat into a process, or writing it to a file with `write`, copies the file directly
+        without reading it into python
     """
-    def __init__(self, filename, raw_bytes=False):
+    def __init__(self, filename, raw_bytes=False, chunks=False, memory_map=False):
         super().__init__()
+        self.__chunk_size = chunk_size(chunks)
+        self.__raw_bytes = raw_bytes or self.__chunk_size is not None
+        self.__memory_map = memory_map
+        self.__mapping = None
         try:
-            self.__handle = open(filename, "r" + "b" * raw_bytes)
+            self.__handle = open(filename, "r" + "b" * (self.__raw_bytes or memory_map))
             self.__errors = []
             self.__exitcode = 0
         except IOError as e:
@@ -58,50 +342,115 @@ class cat(Pipeline): # pylint: disable=C0103
             self.__errors = [str(e).encode('utf-8')]
             self.__exitcode = 1
     def _lines(self):
-        if self.__handle is not None:
+        if self.__handle is None:
+            pass
+        elif self.__memory_map:
+            yield from self.__mapped_lines()
+        elif self.__chunk_size is not None:
+            for block in iter(lambda: self.__handle.read(self.__chunk_size), b""):
+                yield FD.stdout, block
+        elif self.__raw_bytes:
+            for line in self.__handle:
+                yield FD.stdout, line
+        else:
             for line in self.__handle:
                 yield FD.stdout, NoNewline(line)
         for error in self.__errors:
             yield FD.stderr, error
+    def __mapped_lines(self):
+        size = os.fstat(self.__handle.fileno()).st_size
+        if size == 0:
+            return
+        self.__mapping = mmap.mmap(self.__handle.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.__mapping)
+        start = 0
+        while start < size:
+            if self.__chunk_size is not None:
+                end = min(start + self.__chunk_size, size)
+            else:
+                end = self.__mapping.find(b"\n", start) + 1 or size
+            if self.__raw_bytes:
+                yield FD.stdout, view[start:end]
+            else:
+                yield FD.stdout, NoNewline(str(view[start:end], 'utf-8'))
+            start = end
+    def _file(self):
+        """
+        Returns the open file if it has not been read from, for it to be used directly. Otherwise None
+        """
+        if self.__handle is None or self.__handle.closed or self.__handle.tell() != 0:
+            return None
+        return self.__handle
+    def _copy_to(self, output):
+        """
+        Copies the file to the given binary file with sendfile, falling back to reading and writing
+            blocks if that is not supported. Errors are printed to stderr. Returns the exit code
+        """
+        if self.__handle is None:
+            for error in self.__errors:
+                print(error.decode('utf-8'), file=sys.stderr)
+            return self.__exitcode
+        output.flush()
+        source, destination = self.__handle.fileno(), output.fileno()
+        offset = 0
+        try:
+            while True:
+                sent = os.sendfile(destination, source, offset, READ_SIZE * 16)
+                if not sent:
+                    break
+                offset += sent
+        except OSError:
+            for block in iter(lambda: os.pread(source, READ_SIZE, offset), b""):
+                output.write(block)
+                offset += len(block)
+        return self._end()
     def _end(self):
+        if self.__mapping is not None:
+            try:
+                self.__mapping.close()
+            except BufferError:
+                # lines still refer to the mapping, it is closed once they are garbage collected
+                pass
+            self.__mapping = None
         if self.__handle is not None:
             self.__handle.close()
         return self.__exitcode
 
-def re(*command, mode=None, raw_bytes=False):
+def re(*command, mode=None, raw_bytes=False, chunks=False):
     """
     Run the given command, and optionally gather the stdout and stderr
         mode=Collect to gather, mode=Terminal to print normal/red for stdout/stderr
 
     Does not do any shell expansion
     """
-    return se(*command, print_direct=mode is None, raw_bytes=raw_bytes) > mode
+    return se(*command, print_direct=mode is None, raw_bytes=raw_bytes, chunks=chunks) > mode
 
-def r(command, mode=None, raw_bytes=False):
+def r(command, mode=None, raw_bytes=False, chunks=False):
     """
     Like re, but does shell expansion on its string argument
     """
-    return s(command, print_direct=mode is None, raw_bytes=raw_bytes) > mode
+    return s(command, print_direct=mode is None, raw_bytes=raw_bytes, chunks=chunks) > mode
 
-def se(*command, print_direct=False, raw_bytes=False):
+def se(*command, print_direct=False, raw_bytes=False, reader=None, stdin=None, chunks=False):
     """
     Run the given command, and allow ability to gather output
 
-    Does not do any shell expansion
+    Does not do any shell expansion. See Process for the meaning of `reader`, `stdin` and `chunks`
+
+    The command starts once the pipeline is consumed, so that it can be piped into another process.
+        Access `.proc` to start it straight away, e.g., for a server left running in the background
     """
-    pipe = None if print_direct else subprocess.PIPE
     if not all(isinstance(x, str) for x in command):
         raise RuntimeError("Cannot run %s: it has non-string elements" % command)
-    return Process(subprocess.Popen(command, stdout=pipe, stderr=pipe), print_direct, raw_bytes=raw_bytes)
+    return Process(command, False, print_direct, raw_bytes=raw_bytes, reader=reader, stdin=stdin, chunks=chunks)
 
-def s(command, print_direct=False, raw_bytes=False):
+def s(command, print_direct=False, raw_bytes=False, reader=None, stdin=None, chunks=False):
     """
     Like se, but does shell expansion on its string argument
     """
-    pipe = None if print_direct else subprocess.PIPE
     if not isinstance(command, str):
         raise RuntimeError("command argument to s must be of type str but was %s" % type(command))
-    return Process(subprocess.Popen(command, shell=True, stdout=pipe, stderr=pipe), print_direct, raw_bytes=raw_bytes)
+    return Process(command, True, print_direct, raw_bytes=raw_bytes, reader=reader, stdin=stdin, chunks=chunks)
 
 def throw(exc): # pragma: no cover
     """
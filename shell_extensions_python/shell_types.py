@@ -73,8 +73,8 @@ def decode_line(line):
     """
     If a bytes string, decode literally, if NoNewline, do not add a newline, otherwise add a newline
     """
-    if isinstance(line, bytes):
-        return line.decode('utf-8')
+    if isinstance(line, (bytes, bytearray, memoryview)):
+        return bytes(line).decode('utf-8')
     if isinstance(line, NoNewline):
         return line
     return line + os.linesep
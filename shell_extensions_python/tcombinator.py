@@ -2,14 +2,10 @@
 Provides TCombinator.
 """
 
-from threading import Semaphore, Thread
+from collections import deque
+from threading import Condition, Event, Thread
 
-class SIGSEGV:
-    """
-    If you're happy and you know it...
-    """
-    pass
-SIGSEGV = SIGSEGV()
+DEFAULT_CAPACITY = 1024
 
 class EOF:
     """
@@ -17,17 +13,38 @@ class EOF:
     """
 EOF = EOF()
 
+class _Raised:
+    """
+    An exception raised by one of the generators, to be re-raised by the consumer
+    """
+    def __init__(self, exception):
+        self.exception = exception
+
 class TCombinator:
     """
     Takes in any number of asynchronous generators and is an iterable that produces a value
         whenever any of the generators produces a value.
 
+    Values are handed over through a shared bounded queue: producers append to it without taking
+        a lock and only block once `capacity` values are waiting, while the consumer drains
+        everything that is present in one batch. Values appear in the order they were produced.
+
+    If a generator raises an exception, the remaining generators are still consumed, and the
+        exception is then re-raised by the consumer.
+
+    If the consumer stops early, by closing `batches()` or calling `close`, the values still being
+        produced are dropped and each generator is closed once it next produces a value.
+
     For usage examples, see ../tests.py:TestTCombinator
     """
-    def __init__(self, *generators):
-        self.buffer = SIGSEGV
-        self.spaces_available = Semaphore(1)
-        self.items_present = Semaphore(0)
+    def __init__(self, *generators, capacity=DEFAULT_CAPACITY):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1 but was %s" % capacity)
+        self.buffer = deque()
+        self.capacity = capacity
+        self.items_present = Event()
+        self.space_available = Condition()
+        self.closed = False
         self.n_threads = len(generators)
         for generator in generators:
             thread = Thread(target=self._thread, args=[generator])
@@ -35,30 +52,71 @@ class TCombinator:
 
     def _thread(self, generator):
         """
-        A thread that consumes the given generator and pushes each value onto the stack
+        A thread that consumes the given generator and pushes each value onto the queue
         """
-        while True:
-            try:
-                item = next(generator)
-            except StopIteration:
-                item = EOF
-            self.spaces_available.acquire()
-            self.buffer = item
-            self.items_present.release()
-            if item == EOF:
-                break
+        try:
+            for item in generator:
+                if self.closed:
+                    close = getattr(generator, 'close', None)
+                    if close is not None:
+                        close()
+                    break
+                self._push(item)
+        except BaseException as e: # pylint: disable=broad-except
+            self._push(_Raised(e))
+        self._push(EOF)
 
-    def __iter__(self):
+    def _push(self, item):
+        if len(self.buffer) >= self.capacity:
+            with self.space_available:
+                while len(self.buffer) >= self.capacity and not self.closed:
+                    self.space_available.wait()
+        if self.closed:
+            return
+        self.buffer.append(item)
+        if not self.items_present.is_set():
+            self.items_present.set()
+
+    def batches(self):
+        """
+        Yields lists of values, each containing everything that was waiting when the consumer
+            woke up
+        """
         threads_remaining = self.n_threads
-        while True:
-            self.items_present.acquire()
-            item = self.buffer
-            assert item is not SIGSEGV
-            if item != EOF:
-                yield self.buffer
-                self.buffer = SIGSEGV
-            else:
-                threads_remaining -= 1
-            self.spaces_available.release()
-            if threads_remaining == 0:
-                break
+        raised = None
+        try:
+            while threads_remaining:
+                self.items_present.wait()
+                self.items_present.clear()
+                batch = []
+                while self.buffer:
+                    item = self.buffer.popleft()
+                    if item is EOF:
+                        threads_remaining -= 1
+                    elif isinstance(item, _Raised):
+                        raised = raised or item
+                    else:
+                        batch.append(item)
+                with self.space_available:
+                    self.space_available.notify_all()
+                if batch:
+                    yield batch
+        finally:
+            if threads_remaining:
+                self.close()
+        if raised is not None:
+            raise raised.exception
+
+    def close(self):
+        """
+        Stops consuming the generators: values they produce from now on are dropped, and they are
+            closed as soon as they produce another value
+        """
+        self.closed = True
+        self.buffer.clear()
+        with self.space_available:
+            self.space_available.notify_all()
+
+    def __iter__(self):
+        for batch in self.batches():
+            yield from batch
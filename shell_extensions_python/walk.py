@@ -0,0 +1,299 @@
+"""
+Walks directory trees with os.scandir, skipping the paths ignored by .gitignore files
+"""
+
+import os
+import re
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+
+from .fd import FD
+from .interactive import DisplayPath, Listing
+from .pipeline import Pipeline
+from .pipeline_map import unbatch
+
+class IgnoreRule:
+    """
+    A single line of a .gitignore file, relative to the directory containing it
+    """
+    def __init__(self, pattern):
+        self.negated = pattern.startswith("!")
+        if self.negated:
+            pattern = pattern[1:]
+        self.directory_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        # a pattern with a slash before its end is relative to the directory, otherwise it matches
+        #   a name at any depth
+        self.anchored = "/" in pattern
+        self.regex = re.compile(_translate(pattern.lstrip("/")))
+    def matches(self, relative_path, is_dir):
+        """
+        Whether the rule matches the given path, relative to the directory of the .gitignore
+        """
+        if self.directory_only and not is_dir:
+            return False
+        if not self.anchored:
+            relative_path = relative_path.rsplit("/", 1)[-1]
+        return self.regex.fullmatch(relative_path) is not None
+
+def _translate(pattern):
+    """
+    Converts a gitignore glob to a regular expression, in which * and ? do not match a / while
+        ** matches any number of directories
+    """
+    result = []
+    index = 0
+    while index < len(pattern):
+        if pattern.startswith("**/", index):
+            result.append("(?:.*/)?")
+            index += 3
+        elif pattern.startswith("**", index):
+            result.append(".*")
+            index += 2
+        elif pattern[index] == "*":
+            result.append("[^/]*")
+            index += 1
+        elif pattern[index] == "?":
+            result.append("[^/]")
+            index += 1
+        elif pattern[index] == "[" and "]" in pattern[index + 1:]:
+            end = pattern.index("]", index + 1)
+            characters = pattern[index + 1:end]
+            if characters.startswith("!"):
+                characters = "^" + characters[1:]
+            result.append("[" + characters + "]")
+            index = end + 1
+        else:
+            if pattern[index] == "\\" and index + 1 < len(pattern):
+                index += 1
+            result.append(re.escape(pattern[index]))
+            index += 1
+    return "".join(result)
+
+class GitIgnore:
+    """
+    The rules of the .gitignore file in a directory, if there is one
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.rules = []
+        try:
+            with open(os.path.join(directory, ".gitignore"), errors="replace") as handle:
+                for line in handle:
+                    line = line.rstrip("\n").rstrip()
+                    if line and not line.startswith("#"):
+                        self.rules.append(IgnoreRule(line))
+        except OSError:
+            pass
+    def match(self, path, is_dir):
+        """
+        Returns True if the given path is ignored, False if it is explicitly not ignored, and None
+            if none of the rules match it. The last rule that matches takes precedence
+        """
+        relative_path = os.path.relpath(path, self.directory).replace(os.sep, "/")
+        for rule in reversed(self.rules):
+            if rule.matches(relative_path, is_dir):
+                return not rule.negated
+        return None
+
+def is_ignored(ignores, path, is_dir):
+    """
+    Whether the given path is ignored by the given GitIgnores, the innermost directory's last
+    """
+    for ignore in reversed(ignores):
+        ignored = ignore.match(path, is_dir)
+        if ignored is not None:
+            return ignored
+    return False
+
+def walk(path=".", glob=None, gitignore=True):
+    """
+    Yields the paths of the files under the given path, in sorted order within each directory,
+        without following symlinks to directories. The .git directory is always skipped.
+
+    glob: only yield files whose name matches this glob
+    gitignore: skip the files and directories ignored by the .gitignore files in the tree
+    """
+    if not os.path.isdir(path):
+        if glob is None or fnmatch(os.path.basename(path), glob):
+            yield path
+        return
+    yield from _walk(path, glob, [], gitignore)
+
+def _walk(directory, glob, ignores, gitignore):
+    if gitignore:
+        ignore = GitIgnore(directory)
+        if ignore.rules:
+            ignores = ignores + [ignore]
+    try:
+        with os.scandir(directory) as scan:
+            entries = sorted(scan, key=lambda entry: entry.name)
+    except OSError:
+        return
+    for entry in entries:
+        is_dir = entry.is_dir(follow_symlinks=False)
+        if is_dir and entry.name == ".git":
+            continue
+        if ignores and is_ignored(ignores, entry.path, is_dir):
+            continue
+        if is_dir:
+            yield from _walk(entry.path, glob, ignores, gitignore)
+        elif entry.is_file() and (glob is None or fnmatch(entry.name, glob)):
+            yield entry.path
+
+FIND_TYPES = {
+    'f': stat.S_ISREG,
+    'd': stat.S_ISDIR,
+    'l': stat.S_ISLNK,
+}
+
+class Find(Pipeline):
+    """
+    A pipeline of the paths under a directory, found as it is walked, see `find`
+    """
+    def __init__(self, path, name, file_type, mindepth, maxdepth, newer, prune, gitignore, jobs):
+        super().__init__()
+        self.__path = path
+        self.__name = name
+        self.__type = FIND_TYPES[file_type] if file_type is not None else None
+        self.__mindepth = mindepth
+        self.__maxdepth = maxdepth
+        self.__newer = newer
+        self.__prune = prune
+        self.__gitignore = gitignore
+        self.__jobs = jobs
+        self.__scans = set()
+        self.__failed = False
+    def _lines(self):
+        return unbatch(self._batches())
+    def _batches(self):
+        executor = ThreadPoolExecutor(self.__jobs) if self.__jobs else None
+        try:
+            root = DisplayPath(self.__path, "")
+            try:
+                root_stat = os.lstat(self.__path)
+            except OSError as e:
+                self.__failed = True
+                yield FD.stderr, [str(e).encode('utf-8')]
+                return
+            if self.__mindepth <= 0 and self.__selected(root, root_stat):
+                yield FD.stdout, [root]
+            if stat.S_ISDIR(root_stat.st_mode) and self.__descends(root, 0):
+                yield from self.__directory(self.__scan(self.__path, executor), 1, [], executor)
+        finally:
+            for scan in self.__scans:
+                scan.cancel()
+            if executor is not None:
+                executor.shutdown(wait=False)
+    def __scan(self, directory, executor):
+        """
+        Returns a function returning the sorted entries of the directory, which are listed in the
+            thread pool straight away if there is one, and otherwise when the function is called
+        """
+        if executor is None:
+            return lambda: _list(directory)
+        future = executor.submit(_list, directory)
+        self.__scans.add(future)
+        def result():
+            # only the pending scans are kept, so the entries of the directories already walked are freed
+            self.__scans.discard(future)
+            return future.result()
+        return result
+    def __directory(self, scan, depth, ignores, executor):
+        """
+        Yields the batches of the paths under the directory whose entries `scan` returns, each
+            directory followed by its contents
+        """
+        directory, entries, error = scan()
+        if error is not None:
+            self.__failed = True
+            yield FD.stderr, [error]
+            return
+        if self.__gitignore:
+            ignore = GitIgnore(directory)
+            if ignore.rules:
+                ignores = ignores + [ignore]
+        listing = Listing(directory)
+        paths = []
+        for entry in entries:
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if self.__gitignore and (is_dir and entry.name == ".git" or is_ignored(ignores, entry.path, is_dir)):
+                continue
+            path = listing.add(entry, full=True)
+            # the subdirectories are listed ahead of time if there is a thread pool
+            descend = is_dir and self.__descends(path, depth)
+            paths.append((path, entry, self.__scan(entry.path, executor) if descend else None))
+        batch = []
+        for path, entry, subdirectory in paths:
+            if depth >= self.__mindepth and self.__selected(path, entry):
+                batch.append(path)
+            if subdirectory is not None:
+                if batch:
+                    yield FD.stdout, batch
+                    batch = []
+                yield from self.__directory(subdirectory, depth + 1, ignores, executor)
+        if batch:
+            yield FD.stdout, batch
+    def __descends(self, path, depth):
+        if self.__maxdepth is not None and depth >= self.__maxdepth:
+            return False
+        if self.__prune is None:
+            return True
+        if callable(self.__prune):
+            return not self.__prune(path)
+        return not fnmatch(os.path.basename(path), self.__prune)
+    def __selected(self, path, entry):
+        """
+        Whether the path, with the given os.DirEntry or lstat, passes the tests
+        """
+        if self.__name is not None and not fnmatch(os.path.basename(path), self.__name):
+            return False
+        if self.__type is None and self.__newer is None:
+            return True
+        try:
+            path_stat = entry if isinstance(entry, os.stat_result) else entry.stat(follow_symlinks=False)
+        except OSError:
+            return False
+        if self.__type is not None and not self.__type(path_stat.st_mode):
+            return False
+        return self.__newer is None or path_stat.st_mtime > self.__newer
+    def _end(self):
+        return 1 if self.__failed else 0
+
+def _list(directory):
+    """
+    Returns the directory, its entries sorted by name, and the error listing it, if any
+    """
+    try:
+        with os.scandir(directory) as scan:
+            return directory, sorted(scan, key=lambda entry: entry.name), None
+    except OSError as e:
+        return directory, [], str(e).encode('utf-8')
+
+def find(path=".", name=None, type=None, # pylint: disable=redefined-builtin
+         mindepth=0, maxdepth=None, newer=None, prune=None, gitignore=False, jobs=None):
+    """
+    Returns a pipeline of the paths under the given path, including itself, like the unix utility
+        find. The tree is walked with os.scandir as the pipeline is consumed, so
+        `find('/') | head(10)` stops straight away. The paths are DisplayPaths, listed in sorted
+        order within each directory with each directory before its contents, and symlinks to
+        directories are not followed.
+
+    name: only output the paths whose name matches this glob
+    type: only output regular files, 'f', directories, 'd', or symlinks, 'l'
+    mindepth, maxdepth: only output the paths at least or at most this many levels below the path
+    newer: only output the paths modified after this path was, or after this timestamp
+    prune: do not descend into the directories whose name matches this glob, or, if a function,
+        for which it is true
+    gitignore: skip the paths ignored by .gitignore files, and the .git directory
+    jobs: list up to this many directories ahead of time in a pool of threads, which speeds up
+        walking slow file systems such as NFS
+
+    The exit code is 1 if a directory could not be listed, like find
+    """
+    if type is not None and type not in FIND_TYPES:
+        raise ValueError("type should be one of %s but was %r" % (", ".join(FIND_TYPES), type))
+    if isinstance(newer, str):
+        newer = os.stat(newer).st_mtime
+    return Find(path, name, type, mindepth, maxdepth, newer, prune, gitignore, jobs)
@@ -0,0 +1,95 @@
+
+import asyncio
+import threading
+import unittest
+
+from shell_extensions_python import ase, ashell, Collect, Stdout, sort, head, retain, tail, FD
+from shell_extensions_python import async_bridge
+
+from .utilities import reset
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+class TestAsync(unittest.TestCase):
+    @reset
+    def test_collect(self):
+        result = run(ashell('echo 2; echo 3 >&2') > Collect)
+        self.assertEqual("2\n", result.stdout())
+        self.assertEqual("3\n", result.stderr())
+        self.assertTrue(result)
+    @reset
+    def test_await(self):
+        self.assertTrue(run(_await(ase('true'))))
+        self.assertFalse(run(_await(ase('false'))))
+    @reset
+    def test_async_for(self):
+        async def lines():
+            pipeline = ashell('echo abc >&2; sleep 0.1; echo def')
+            result = [item async for item in pipeline]
+            return result, pipeline.exitcode
+        self.assertEqual(([(FD.stderr, 'abc\n'), (FD.stdout, 'def\n')], 0), run(lines()))
+    @reset
+    def test_maps(self):
+        result = run((ashell('echo 3; echo 2; echo 4 >&2') | int | (lambda x: x * 2)) / sort() > Collect)
+        self.assertEqual([6, 4], result.stdout(raw=True))
+        result = run(ashell('echo 3; echo 2; echo 1') | sort() | head(2) > Collect)
+        self.assertEqual("1\n2\n", result.stdout())
+    @reset
+    def test_collector(self):
+        self.assertEqual((2, 3), run(ashell('echo 2; echo 3; echo 4 >&2') % int >= Stdout()))
+    @reset
+    def test_concurrent(self):
+        async def many():
+            return await asyncio.gather(*[ase('echo', str(i)) >= Stdout() for i in range(50)])
+        self.assertEqual([("%s\n" % i,) for i in range(50)], run(many()))
+    @reset
+    def test_no_threads(self):
+        async def collect():
+            threads = _threads()
+            pipeline = ashell('seq 10') | int | retain(lambda x: x % 2) | sort(lambda x: -x) | head(4) | tail(3)
+            result = await (pipeline >= Stdout())
+            return result, _threads() - threads
+        self.assertEqual(((7, 5, 3), 0), run(collect()))
+    @reset
+    def test_custom_collector(self):
+        self.assertEqual(3, run(ashell('seq 3') >= (lambda lines: len(list(lines)))))
+    @reset
+    def test_custom_collector_stops_early(self):
+        self.assertEqual((FD.stdout, "1\n"), run(ashell('seq 5000') >= (lambda lines: next(iter(lines)))))
+        pipeline = ashell('yes') | str.strip
+        self.assertEqual((FD.stdout, "y"), run(pipeline >= (lambda lines: next(iter(lines)))))
+        self.assertEqual(0, pipeline.exitcode)
+    @reset
+    def test_bounded_queue(self):
+        async def collect():
+            pipeline = ashell('seq 100')
+            old_size = async_bridge.QUEUE_SIZE
+            async_bridge.QUEUE_SIZE = 2
+            try:
+                return await (pipeline >= (lambda lines: [int(line) for fd, line in lines]))
+            finally:
+                async_bridge.QUEUE_SIZE = old_size
+        self.assertEqual(list(range(1, 101)), run(collect()))
+    @reset
+    def test_head_terminates(self):
+        result = run(ase('yes') | str.strip | head(2) > Collect)
+        self.assertEqual("y\ny\n", result.stdout())
+        self.assertTrue(result)
+        self.assertEqual(0, run(ase('sleep', '5') | head(0) > Collect).returncode)
+    @reset
+    def test_head_full_buffer(self):
+        result = run(ashell('seq 100000; sleep 0.2') | head(1) > Collect)
+        self.assertEqual("1\n", result.stdout())
+        self.assertTrue(result)
+    @reset
+    def test_invalid_args(self):
+        self.assertRaises(RuntimeError, lambda: ashell(None))
+        self.assertRaises(RuntimeError, lambda: ase(['a']))
+
+def _threads():
+    # asyncio's child watcher waits for each process in a thread, which can outlive the process
+    return sum(1 for thread in threading.enumerate() if "waitpid-" not in thread.name)
+
+async def _await(pipeline):
+    return await pipeline
@@ -1,7 +1,7 @@
 
 import unittest
 
-from shell_extensions_python import write, cat, Collect, rm, mkdir
+from shell_extensions_python import write, read, cat, se, Collect, Stdout, rm, mkdir
 
 from .utilities import reset
 
@@ -23,3 +23,47 @@ class TestCat(unittest.TestCase):
         self.assertEqual(False, bool(result))
         self.assertIn("Is a directory", result.stderr())
         rm('folder')
+    @reset
+    def test_raw_bytes(self):
+        write('file', 'contents\nline 2')
+        self.assertEqual((b'contents\n', b'line 2'), cat('file', raw_bytes=True) >= Stdout())
+        rm('file')
+    @reset
+    def test_chunks(self):
+        write('file', 'λ' * 1000)
+        result = cat('file', chunks=7) > Collect
+        self.assertEqual(286, len(result.stdout(raw=True)))
+        self.assertEqual('λ' * 1000, result.stdout())
+        self.assertEqual((), cat('nonexistant', chunks=True) >= Stdout())
+        rm('file')
+    @reset
+    def test_memory_map(self):
+        write('file', 'λ\n\nline 3')
+        self.assertEqual(('λ\n', '\n', 'line 3'), cat('file', memory_map=True) >= Stdout())
+        lines = cat('file', memory_map=True, raw_bytes=True) >= Stdout()
+        self.assertTrue(all(isinstance(line, memoryview) for line in lines))
+        self.assertEqual([b'\xce\xbb\n', b'\n', b'line 3'], [bytes(line) for line in lines])
+        self.assertEqual('λ\n\nline 3', (cat('file', memory_map=True, chunks=2) > Collect).stdout())
+        write('empty', '')
+        self.assertEqual((), cat('empty', memory_map=True) >= Stdout())
+        self.assertFalse(cat('nonexistant', memory_map=True) > Collect)
+        rm('file', 'empty')
+    @reset
+    def test_direct_stdin(self):
+        write('file', 'b\na\n')
+        process = se('sort') < cat('file')
+        self.assertEqual(('a\n', 'b\n'), process >= Stdout())
+        self.assertIsNone(process.proc.stdin)
+        result = (se('sort') < cat('nonexistant')) > Collect
+        self.assertEqual(1, result.returncode)
+        self.assertIn("No such file", result.stderr())
+        rm('file')
+    @reset
+    def test_write(self):
+        write('file', 'λ' * 100000)
+        self.assertTrue(write('copy', cat('file')))
+        self.assertEqual('λ' * 100000, read('copy'))
+        self.assertTrue(write('copy', cat('file'), append=True))
+        self.assertEqual('λ' * 200000, read('copy'))
+        self.assertFalse(write('missing', cat('nonexistant')))
+        rm('file', 'copy', 'missing')
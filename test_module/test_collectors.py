@@ -0,0 +1,60 @@
+
+import asyncio
+import unittest
+from collections import Counter
+
+from shell_extensions_python import s, ashell, col, cols, Count, GroupBy, TopK, Histogram, Columns, FD
+from shell_extensions_python.collectors import Aggregate
+
+from .utilities import reset
+
+LOG = 'echo "a error 3"; echo "b info 1"; echo "a info 4"; echo "a error 2"; echo "c error 7"; echo oops >&2'
+
+class TestCollectors(unittest.TestCase):
+    @reset
+    def test_count(self):
+        self.assertEqual(5, s(LOG) >= Count())
+        self.assertEqual(1, s(LOG) >= Count(fds={FD.stderr}))
+        self.assertEqual(0, s('true') >= Count())
+    @reset
+    def test_incomplete_aggregate(self):
+        class Started(Aggregate):
+            def start(self):
+                return 0
+        self.assertRaises(TypeError, lambda: Started({FD.stdout}))
+    @reset
+    def test_group_by(self):
+        self.assertEqual(Counter({'a': 3, 'b': 1, 'c': 1}), s(LOG) | str.split >= GroupBy(col(0)))
+        self.assertEqual(Counter({'a': 9, 'b': 1, 'c': 7}), s(LOG) | str.split >= GroupBy(col(0), value=col(2, int)))
+        self.assertEqual({'error': ['a', 'a', 'c'], 'info': ['b', 'a']},
+                         s(LOG) | str.split >= GroupBy(col(1), list, value=col(0)))
+        self.assertEqual({'error': 3, 'info': 2}, s(LOG) | str.split >= GroupBy(col(1), Count()))
+        self.assertEqual({'error': (7,), 'info': (4,)},
+                         s(LOG) | str.split >= GroupBy(col(1), TopK(1), value=col(2, int)))
+    @reset
+    def test_top_k(self):
+        self.assertEqual(('c error 7\n', 'a info 4\n'), s(LOG) >= TopK(2, key=lambda line: int(line.split()[2])))
+        self.assertEqual((3, 3, 2), s('echo 1; echo 3; echo 2; echo 3') | int >= TopK(3))
+        self.assertEqual(('a', 'b'), s('echo a; echo b; echo c') | str.strip >= TopK(2, key=lambda x: 1))
+        self.assertEqual((), s('echo 1') >= TopK(0))
+    @reset
+    def test_histogram(self):
+        self.assertEqual((2, 2, 2), s('seq 0 5') >= Histogram([0, 2, 4, 5]))
+        self.assertEqual((1, 1), s('echo -1; echo 0.5; echo 1; echo 2') >= Histogram([0, 1, 1.5]))
+        self.assertEqual({0: 2, 10: 1, 20: 2}, s('echo 1; echo 9; echo 10; echo 21; echo 29') >= Histogram(10))
+        self.assertRaises(ValueError, lambda: Histogram(0))
+        self.assertRaises(ValueError, lambda: Histogram([1]))
+    @reset
+    def test_columns(self):
+        self.assertEqual([3, 1, 4, 2, 7], list(s(LOG) >= Columns(col(2, int))))
+        counts, values = s('seq 5 | while read i; do echo $i x $((i * i)); done') >= Columns(cols((0, int), 2), chunk=2)
+        self.assertEqual([1, 2, 3, 4, 5], list(counts))
+        self.assertEqual([1.0, 4.0, 9.0, 16.0, 25.0], list(values))
+        self.assertEqual([], list(s('true') >= Columns(col(0))))
+        self.assertEqual([1.5, 2.0], list(s('echo 1.5,a; echo 2,b') >= Columns(col(0), split=lambda x: x.split(','))))
+        self.assertRaises(ValueError, lambda: Columns(col(0), chunk=0))
+    @reset
+    def test_async(self):
+        self.assertEqual(5, asyncio.run(ashell(LOG) >= Count()))
+        self.assertEqual(Counter({'error': 3, 'info': 2}),
+                         asyncio.run(ashell(LOG) | str.split >= GroupBy(col(1))))
@@ -1,7 +1,7 @@
 
 import unittest
 
-from shell_extensions_python import glob, globs, write, rm
+from shell_extensions_python import glob, globs, iglobs, write, rm, mkdir
 
 from .utilities import reset
 
@@ -24,3 +24,32 @@ class TestGlobs(unittest.TestCase):
         self.assertEqual(['file', 'second_file'], globs("*f*"))
         self.assertRaises(RuntimeError, lambda: glob("*f*"))
         rm('file', 'second_file')
+    @reset
+    def test_iglobs(self):
+        mkdir('b/d')
+        mkdir('b/.hidden')
+        write('a.py', '')
+        write('b/c.py', '')
+        write('b/d/e.py', '')
+        write('b/e.py', '')
+        write('b/.hidden/f.py', '')
+        write('b/.g.py', '')
+        write('.h.py', '')
+        self.assertEqual(['a.py'], list(iglobs('*.py')))
+        self.assertEqual({'b/c.py', 'b/e.py'}, set(iglobs('b/*.py')))
+        self.assertEqual(['b/c.py', 'b/d/e.py', 'b/e.py'], list(iglobs('b/**/*.py', sort=True, recursive=True)))
+        self.assertEqual(['b/d/e.py'], list(iglobs('b/**/*.py', sort=True)))
+        self.assertEqual(['b/.g.py', 'b/.hidden'], list(iglobs('b/.*', sort=True)))
+        for pattern in '*', '**/*.py', 'b/**', '*/*', 'b/d/e.py', 'missing/*', 'b/**/.g.py', '**/.h.py', 'b/**/.*', \
+                '**/', 'b/**/', '*/':
+            for recursive in False, True:
+                self.assertEqual(sorted(iglobs(pattern, recursive=recursive)),
+                                 sorted(iglobs(pattern, sort=True, recursive=recursive)))
+        rm('a.py', '.h.py', 'b', recursively=True)
+    @reset
+    def test_glob_stops_early(self):
+        for i in range(3):
+            write('file%s' % i, '')
+        with self.assertRaisesRegex(RuntimeError, r"at least 2 matches \(file\d, file\d, \.\.\.\)"):
+            glob('file*')
+        rm('file0', 'file1', 'file2')
@@ -1,7 +1,10 @@
 
+import asyncio
+import pickle
 import unittest
 
-from shell_extensions_python import cgrep
+from shell_extensions_python import cgrep, grep, grep_files, rgrep, s, ashell, write, rm, mkdir, head, sort, pmap, \
+    Stdout, Both
 from shell_extensions_python.colors import PrintColors
 
 from .utilities import reset
@@ -19,3 +22,103 @@ class TestLs(unittest.TestCase):
     def test_removed_lines_grep(self):
         self.assertEqual("{1}h{0}e{1}ll{0}o{1}\n".format(PrintColors.red_bright, PrintColors.reset),
                          repr(cgrep("[aeiou]", "hello\nbcd", remove_lines=True, color=PrintColors.red_bright)))
+    @reset
+    def test_grepped_string(self):
+        grepped = cgrep("l+|$", "hello\nabc\nworld\n")
+        self.assertEqual("hello\nabc\nworld\n", grepped)
+        self.assertEqual([2, 4, 5, 5, 9, 9, 13, 14, 15, 15], list(grepped.match_offsets))
+        self.assertEqual([(False, "he"), (True, "ll"), (False, "o"), (True, ""), (False, "\n"),
+                          (False, "abc"), (True, ""), (False, "\n"),
+                          (False, "wor"), (True, "l"), (False, "d"), (True, ""), (False, "\n")],
+                         grepped.components)
+        self.assertEqual(("hello", "world"), tuple(cgrep("o", "hello\nabc\nworld").lines()[:2]))
+    @reset
+    def test_fixed_cgrep(self):
+        self.assertEqual("{1}a{0}.{1}b\n".format(PrintColors.red_bright, PrintColors.reset),
+                         repr(cgrep(".", "a.b\ncd", fixed=True, color=PrintColors.red_bright)))
+    @reset
+    def test_grep_map(self):
+        lines = s('printf "hello\nbcd\nhat\n"') | grep("[aeiou]") >= Stdout()
+        self.assertEqual(('hello\n', 'hat\n'), lines)
+        self.assertEqual("{1}h{0}e{1}ll{0}o{1}\n".format(PrintColors.red_bright, PrintColors.reset), repr(lines[0]))
+        self.assertEqual(('bcd\n',), s('printf "hello\nbcd\nhat\n"') | grep("[aeiou]", invert=True) >= Stdout())
+        self.assertEqual(('2\n',), s('printf "hello\nbcd\nhat\n"') | grep("H", ignore_case=True, count=True) >= Stdout())
+        self.assertEqual(('a.b\n',), s('echo a.b; echo axb') | grep(".", fixed=True) >= Stdout())
+        self.assertEqual(('hat\n',), asyncio.run(ashell('echo hello; echo hat') | grep("a") >= Stdout()))
+    @reset
+    def test_pickle(self):
+        string = cgrep("[aeiou]", "hello\nbcd\nhat")
+        copy = pickle.loads(pickle.dumps(string))
+        self.assertEqual(string, copy)
+        self.assertEqual(repr(string), repr(copy))
+        write('a', 'hello\nworld\n')
+        [line] = rgrep("w", 'a') >= Stdout()
+        copy = pickle.loads(pickle.dumps(line))
+        self.assertEqual(('a:2:world\n', repr(line), 'a', 2), (copy, repr(copy), copy.path, copy.line_number))
+        rm('a')
+    @reset
+    def test_grep_in_processes(self):
+        lines = s('seq 300') | grep("7") | sort(memory=10) >= Stdout()
+        self.assertEqual(sorted("%s\n" % i for i in range(1, 301) if "7" in str(i)), list(lines))
+        self.assertEqual([(False, '10'), (True, '7'), (False, '\n')], lines[0].components)
+        self.assertEqual(('hat\n',), s('echo hello; echo hat') | grep("a") | pmap(str) >= Stdout())
+    @reset
+    def test_grep_context(self):
+        self.assertEqual(('4\n', '5\n', '6\n', '7\n', '--\n', '14\n', '15\n', '16\n'),
+                         s('seq 20') | grep("^(5|6|15)$", context=1) >= Stdout())
+        self.assertEqual(('1\n', '2\n', '3\n'), s('seq 5') | grep("^2$", context=1) >= Stdout())
+    @reset
+    def test_grep_files(self):
+        write('a', 'hello\nworld\n')
+        write('b', 'goodbye\n')
+        self.assertEqual(('a:hello\n', 'b:goodbye\n'), grep_files("[oe]$", 'a', 'b') >= Stdout())
+        self.assertEqual(('world\n',), grep_files("w", 'a') >= Stdout())
+        self.assertEqual(('a\n',), grep_files("l", 'a', 'b', files_with_matches=True, fixed=True) >= Stdout())
+        self.assertEqual(('b\n',), grep_files("^g", 'a', 'b', files_with_matches=True) >= Stdout())
+        self.assertEqual(('a:2\n', 'b:1\n'), grep_files("o", 'a', 'b', count=True) >= Stdout())
+        pipeline = grep_files("x", 'a', 'b')
+        self.assertEqual((), pipeline >= Stdout())
+        self.assertEqual(1, pipeline.exitcode)
+        pipeline = grep_files("o", 'a', 'c')
+        self.assertEqual(3, len(pipeline >= Both()))
+        self.assertEqual(2, pipeline.exitcode)
+        rm('a')
+        rm('b')
+    @reset
+    def test_rgrep(self):
+        mkdir('src/lib')
+        write('src/lib/a.py', 'import os\nx = 1\nimport re')
+        write('src/b.txt', 'nothing\nimport this\n')
+        write('src/c.bin', 'import\0binary\n')
+        write('src/ignored.py', 'import sys\n')
+        write('.gitignore', 'ignored.py\n')
+        lines = rgrep("^import", '.') >= Stdout()
+        self.assertEqual(('./src/b.txt:2:import this\n', './src/lib/a.py:1:import os\n', './src/lib/a.py:3:import re\n'),
+                         lines)
+        self.assertEqual(('./src/lib/a.py', 3), (lines[2].path, lines[2].line_number))
+        self.assertEqual("{1}./src/lib/a.py:3:{1}{0}import{1} re\n".format(PrintColors.red_bright, PrintColors.reset),
+                         repr(lines[2]))
+        self.assertEqual(('./src/lib/a.py\n',), rgrep("X", '.', glob='*.py', ignore_case=True, files_with_matches=True) >= Stdout())
+        self.assertEqual(('src/lib/a.py:2:x = 1\n',), rgrep("x = ", 'src', fixed=True, jobs=1) >= Stdout())
+        self.assertEqual(1, len(rgrep("import", '.', jobs=1) | head(1) >= Stdout()))
+        pipeline = rgrep("g\\s+import", '.')
+        self.assertEqual((), pipeline >= Stdout())
+        self.assertEqual(1, pipeline.exitcode)
+        rm('src', recursively=True)
+        rm('.gitignore')
+    @reset
+    def test_multiple_patterns(self):
+        red, blue, reset_color = PrintColors.red_bright, PrintColors.blue, PrintColors.reset
+        self.assertEqual("{2}the {1}cat{2} and {0}car{2}\n".format(red, blue, reset_color),
+                         repr(cgrep(["car", "cat"], "the cat and car\nthe dog", fixed=True, color=[red, blue])))
+        grepped = cgrep(["b+", "(a)(b)", "c"], "abc\nbbd")
+        self.assertEqual([None, 1, None, 2, None, None, 0, None], grepped.patterns)
+        self.assertEqual(("catalog\n", "dogs\n"), s('echo catalog; echo dogs; echo ca') | grep(["CAT", "Dog"], fixed=True, ignore_case=True) >= Stdout())
+        line, = s('echo ca cat car') | grep(["ca", "cat"], fixed=True) >= Stdout()
+        self.assertEqual([(False, ""), (True, "ca"), (False, " "), (True, "cat"), (False, " "), (True, "ca"), (False, "r\n")],
+                         line.components)
+        self.assertEqual([None, 0, None, 1, None, 0, None], line.patterns)
+        write('a', 'error 17\nwarning 3\nok\n')
+        self.assertEqual(('a:1:error 17\n', 'a:2:warning 3\n'), rgrep(["^error", "warning"], 'a') >= Stdout())
+        self.assertRaises(ValueError, lambda: grep([]))
+        rm('a')
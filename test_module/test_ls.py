@@ -5,6 +5,7 @@ from random import randint
 
 from shell_extensions_python import ls, cd, rm, mkdir, write, r
 from shell_extensions_python.interactive import FileType, DisplayPath
+from shell_extensions_python.path_manipulation import join
 
 from .utilities import reset
 
@@ -47,7 +48,7 @@ class TestLs(unittest.TestCase):
         r('chmod +x executable')
         deleted, executable, file, folder, link = ls()
         rm('deleted')
-        self.assertEqual(FileType.normal_file, deleted.type)
+        self.assertEqual(FileType.missing, deleted.type)
         self.assertEqual(FileType.normal_file, file.type)
         self.assertEqual(FileType.executable, executable.type)
         self.assertEqual(FileType.directory, folder.type)
@@ -55,5 +56,32 @@ class TestLs(unittest.TestCase):
         rm('file', 'folder', 'executable')
         r('rm link')
     @reset
+    def test_deferred_classification(self):
+        write('a', '')
+        write('b', '')
+        a, b = ls()
+        r('chmod +x a b')
+        self.assertEqual(FileType.executable, a.type)
+        r('chmod -x b')
+        self.assertEqual(FileType.executable, b.type)
+        self.assertEqual(None, b.entry)
+        self.assertEqual(FileType.normal_file, DisplayPath('a', '.', FileType.normal_file).type)
+        rm('a', 'b')
+    @reset
+    def test_classify_entry(self):
+        write('file', 'contents')
+        write('executable', '')
+        mkdir('folder')
+        r('chmod +x executable')
+        r('ln -s file link')
+        r('ln -s nonexistant broken')
+        r('ln -s folder folder_link')
+        for directory in '.', '/', '/dev':
+            for path in ls(directory):
+                self.assertEqual(FileType.classify(join(directory, path)), path.type, path)
+        self.assertEqual(FileType.missing, ls()[0].type)
+        rm('file', 'executable', 'folder', 'link', 'folder_link')
+        r('rm broken')
+    @reset
     def test_missing(self):
         self.assertEqual(FileType.missing, DisplayPath("nonexistant", ".").type)
@@ -1,6 +1,11 @@
 import unittest
 
-from shell_extensions_python import s, Collect, sort, FD, head, retain
+import time
+
+from shell_extensions_python import s, se, cat, write, rm, Collect, sort, FD, head, retain, tail, window, \
+    dedupe_adjacent, sample, pmap, col, cols
+from shell_extensions_python.pipeline_map import LineMap, FusedMap, fuse
+from shell_extensions_python.process_readers import thread_reader
 
 from .utilities import reset
 
@@ -46,10 +51,115 @@ class TestMap(unittest.TestCase):
         self.assertEqual([(FD.stderr, "0\n"), (FD.stdout, "2\n"), (FD.stdout, "3\n"), (FD.stderr, "4\n")],
                          list(s('echo 3; echo 2; echo 4 >&2; echo 0 >&2') % sort()))
     @reset
+    def test_sort_options(self):
+        command = 'echo 10; echo 9; echo 10; echo x >&2; echo 1'
+        self.assertEqual("1\n10\n10\n9\n", (s(command) | sort() > Collect).stdout())
+        self.assertEqual("1\n9\n10\n10\n", (s(command) | sort(numeric=True) > Collect).stdout())
+        self.assertEqual("10\n9\n1\n", (s(command) | sort(numeric=True, reverse=True, unique=True) > Collect).stdout())
+        self.assertEqual("x\n", (s(command) | sort(numeric=True) > Collect).stderr())
+    @reset
+    def test_sort_spill(self):
+        numbers = [(i * 7919) % 1000 for i in range(1000)]
+        command = 'echo "%s"; echo err >&2' % "\n".join(map(str, numbers))
+        result = s(command) | int | sort(memory=2000) > Collect
+        self.assertEqual(sorted(numbers), result.stdout(raw=True))
+        self.assertEqual("err\n", result.stderr())
+        result = s(command) | int | sort(lambda x: x % 10, reverse=True, memory=100) > Collect
+        self.assertEqual(sorted(numbers, key=lambda x: x % 10, reverse=True), result.stdout(raw=True))
+        write('file', "\n".join(map(str, numbers)) + "\n")
+        result = cat('file', memory_map=True, raw_bytes=True) | sort(memory=1) > Collect
+        self.assertEqual(sorted(b"%d\n" % number for number in numbers), result.stdout(raw=True))
+        rm('file')
+    @reset
     def test_head_basic(self):
         result = s('echo 1; echo 2; echo 3; echo 4; echo 5') | head(3) > Collect
         self.assertEqual("1\n2\n3\n", result.stdout())
     @reset
+    def test_head_terminates_upstream(self):
+        start = time.time()
+        for reader in None, thread_reader:
+            result = se('yes', reader=reader) | (lambda x: x.strip().upper()) | head(3) > Collect
+            self.assertEqual("Y\nY\nY\n", result.stdout())
+            self.assertEqual(0, result.returncode)
+        self.assertEqual(0, (se('yes') | se('cat') | head(1) > Collect).returncode)
+        self.assertEqual(0, (se('sleep', '5') | head(0) > Collect).returncode)
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(2, (s('echo a; exit 2') | head(2) > Collect).returncode)
+    @reset
+    def test_head_stops_feeder(self):
+        write('file', 'a\nb\n')
+        start = time.time()
+        result = se('yes') | str.strip | se('cat') | head(2) > Collect
+        self.assertEqual("y\ny\n", result.stdout())
+        self.assertTrue(result)
+        self.assertEqual("a\n", (cat('file') | head(1) > Collect).stdout())
+        self.assertLess(time.time() - start, 2)
+        rm('file')
+    @reset
+    def test_tail(self):
+        result = s('seq 100000; echo err >&2') | tail(3) > Collect
+        self.assertEqual("99998\n99999\n100000\n", result.stdout())
+        self.assertEqual("err\n", result.stderr())
+        self.assertEqual("", (s('seq 3') | tail(0) > Collect).stdout())
+        self.assertEqual("1\n2\n", (s('seq 2') | tail(5) > Collect).stdout())
+    @reset
+    def test_window(self):
+        result = s('seq 4') | int | window(2) > Collect
+        self.assertEqual([(1, 2), (2, 3), (3, 4)], result.stdout(raw=True))
+        self.assertEqual([], (s('seq 2') | window(3) > Collect).stdout(raw=True))
+    @reset
+    def test_dedupe_adjacent(self):
+        result = s('echo a; echo a; echo b; echo a; echo A') | dedupe_adjacent(str.lower) > Collect
+        self.assertEqual("a\nb\na\n", result.stdout())
+    @reset
+    def test_sample(self):
+        self.assertEqual("1\n2\n3\n", (s('seq 3') | sample(1) > Collect).stdout())
+        self.assertEqual("", (s('seq 3') | sample(0) > Collect).stdout())
+        first = (s('seq 1000') | sample(0.1, seed=4) > Collect).stdout()
+        self.assertEqual(first, (s('seq 1000') | sample(0.1, seed=4) > Collect).stdout())
+        self.assertLess(20, len(first.split()))
+        self.assertLess(len(first.split()), 200)
+        self.assertRaises(ValueError, lambda: sample(2))
+    @reset
+    def test_pmap(self):
+        result = s('seq 1000; echo 7 >&2') | int | pmap(_square, workers=2, chunksize=16) > Collect
+        self.assertEqual([i * i for i in range(1, 1001)], result.stdout(raw=True))
+        self.assertEqual("7\n", result.stderr())
+        result = s('seq 100') | int | pmap(_square, workers=3, chunksize=7, ordered=False) > Collect
+        self.assertEqual([i * i for i in range(1, 101)], sorted(result.stdout(raw=True)))
+        self.assertEqual([4], (s('echo 2') | int | pmap(_square) > Collect).stdout(raw=True))
+        self.assertRaises(ValueError, lambda: s('echo 2') | int | pmap(_square, chunksize=0) > Collect)
+    @reset
+    def test_fusion(self):
+        fused = fuse(LineMap(int, {FD.stdout}), retain(bool)({FD.stdout}))
+        self.assertIsInstance(fused, FusedMap)
+        self.assertEqual(3, len(fuse(fused, LineMap(str, {FD.stderr})).stages()))
+        self.assertIsNone(fuse(fused, sort()({FD.stdout})))
+        pipeline = s('seq 10; echo 5 >&2') | int | retain(lambda x: x % 2)
+        pipeline = (pipeline / int | (lambda x: x * 10)) % (lambda x: x + 1)
+        result = pipeline > Collect
+        self.assertEqual([11, 31, 51, 71, 91], result.stdout(raw=True))
+        self.assertEqual([6], result.stderr(raw=True))
+        result = s('seq 6') | int | head(4) | (lambda x: x * 2) | retain(lambda x: x > 2) > Collect
+        self.assertEqual([4, 6, 8], result.stdout(raw=True))
+    @reset
+    def test_batches(self):
+        pipeline = s('seq 10000; echo err >&2') | int | retain(lambda x: x % 2) | head(4000)
+        batches = list(pipeline.batches())
+        self.assertLess(len(batches), 1000)
+        self.assertEqual(0, pipeline.exitcode)
+        self.assertTrue(all(lines for _, lines in batches))
+        self.assertEqual(list(range(1, 8000, 2)), [line for fd, lines in batches if fd == FD.stdout for line in lines])
+        adapted = list((s('seq 3') | str.strip | tail(2)).batches())
+        self.assertEqual([(FD.stdout, ['2']), (FD.stdout, ['3'])], adapted)
+        data = [['a', '1', 'x'], ['b', '2', 'y']]
+        self.assertEqual([1, 2], col(1, int).map_batch(data))
+        self.assertEqual(['a', 'b'], col(0).map_batch(data))
+        self.assertEqual([('a', 'x'), ('b', 'y')], cols(0, 2).map_batch(data))
+        self.assertEqual([('a',), ('b',)], cols(0).map_batch(data))
+        self.assertEqual([('a', 1), ('b', 2)], cols(0, (1, int)).map_batch(data))
+        self.assertEqual([cols(0, 2)(line) for line in data], cols(0, 2).map_batch(data))
+    @reset
     def test_head_on_wrong_stream(self):
         result = s('echo 1; echo 2; echo 3; echo 4; echo 5') / head(3) > Collect
         self.assertEqual("1\n2\n3\n4\n5\n", result.stdout())
@@ -76,3 +186,6 @@ class TestMap(unittest.TestCase):
         result = s('echo 1; echo 2; echo 3; echo 4; echo 5 >&2; echo 6 >&2') % retain(lambda x: int(x) % 2) > Collect
         self.assertEqual("1\n3\n", result.stdout())
         self.assertEqual("5\n", result.stderr())
+
+def _square(x):
+    return x * x
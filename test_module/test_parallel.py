@@ -0,0 +1,57 @@
+
+import time
+import unittest
+
+from shell_extensions_python import parallel, s, se, Collect, Stdout, head
+
+from .utilities import reset
+
+class TestParallel(unittest.TestCase):
+    @reset
+    def test_tagged_output(self):
+        result = parallel(['echo a', ('echo', 'b'), lambda: s('echo c >&2')], jobs=2) > Collect
+        self.assertEqual(['echo a\ta', 'echo b\tb'], sorted(result.stdout(as_lines=True)))
+        self.assertEqual("2\tc\n", result.stderr())
+        self.assertTrue(result)
+    @reset
+    def test_untagged(self):
+        self.assertEqual({'1\n', '2\n', '3\n'},
+                         parallel(['echo %s' % i for i in range(1, 4)], tag=False) >= Stdout(set))
+    @reset
+    def test_combine(self):
+        commands = ['false', 'true']
+        self.assertFalse(parallel(commands) > None)
+        self.assertTrue(parallel(commands, combine='|') > None)
+        self.assertTrue(parallel(commands, combine='+') > None)
+        self.assertFalse(parallel(commands[::-1], combine='+') > None)
+        self.assertTrue(parallel([]) > None)
+    @reset
+    def test_concurrency(self):
+        start = time.time()
+        self.assertTrue(parallel(['sleep 0.3'] * 4, jobs=4) > None)
+        self.assertLess(time.time() - start, 1)
+    @reset
+    def test_fail_fast(self):
+        start = time.time()
+        result = parallel(['sleep 0.1; false', ('sleep', '5'), 'echo never'], jobs=2, fail_fast=True) > Collect
+        self.assertLess(time.time() - start, 2)
+        self.assertFalse(result)
+        self.assertEqual("", result.stdout())
+    @reset
+    def test_invalid(self):
+        self.assertRaises(RuntimeError, lambda: parallel(['true'], combine='^'))
+        self.assertRaises(RuntimeError, lambda: parallel(['true'], jobs=0))
+        self.assertRaises(RuntimeError, lambda: parallel([2]) > None)
+    @reset
+    def test_fail_fast_pipelines(self):
+        for slow in (lambda: se('sleep', '3') | str), (lambda: se('sleep', '3') | se('cat')):
+            start = time.time()
+            self.assertFalse(parallel(['sleep 0.1; false', slow], jobs=2, fail_fast=True) > None)
+            self.assertLess(time.time() - start, 2)
+    @reset
+    def test_head(self):
+        start = time.time()
+        result = parallel([('yes',), ('sleep', '5')], tag=False) | head(3) > Collect
+        self.assertEqual("y\ny\ny\n", result.stdout())
+        self.assertTrue(result)
+        self.assertLess(time.time() - start, 2)
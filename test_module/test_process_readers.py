@@ -0,0 +1,37 @@
+
+import unittest
+
+from shell_extensions_python import s, Collect
+from shell_extensions_python.fd import FD
+from shell_extensions_python.process_readers import LineSplitter, thread_reader, selector_reader
+
+from .utilities import reset
+
+class TestLineSplitter(unittest.TestCase):
+    def test_split_across_blocks(self):
+        splitter = LineSplitter()
+        self.assertEqual([], splitter.feed(b"ab"))
+        self.assertEqual([b"abc\n", b"d\n"], splitter.feed(b"c\nd\ne"))
+        self.assertEqual([], splitter.feed(b"f"))
+        self.assertEqual([b"ef\n"], splitter.feed(b"\n"))
+        self.assertEqual([], splitter.finish())
+    def test_no_trailing_newline(self):
+        splitter = LineSplitter()
+        self.assertEqual([b"a\n"], splitter.feed(b"a\nb"))
+        self.assertEqual([b"b"], splitter.finish())
+
+class TestReaders(unittest.TestCase):
+    @reset
+    def test_readers_agree(self):
+        for reader in thread_reader, selector_reader:
+            result = s('echo 2; echo 3 >&2; printf 4', reader=reader) > Collect
+            self.assertEqual("2\n4", result.stdout())
+            self.assertEqual("3\n", result.stderr())
+    @reset
+    def test_selector_order(self):
+        result = list(s('echo abc >&2; sleep 0.1; echo def', reader=selector_reader))
+        self.assertEqual([(FD.stderr, 'abc\n'), (FD.stdout, 'def\n')], result)
+    @reset
+    def test_long_output(self):
+        result = s('seq 100000', reader=selector_reader) > Collect
+        self.assertEqual([str(i) for i in range(1, 100001)], result.stdout(as_lines=True))
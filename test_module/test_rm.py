@@ -62,3 +62,28 @@ class TestRm(unittest.TestCase):
         self.assertEqual(['existant', 'folder'], ls())
         rm('existant', 'folder', recursively=True)
         self.assertEqual([], ls())
+    @reset
+    def test_rm_dry_run(self):
+        mkdir('folder/sub')
+        write('folder/sub/file', '')
+        write('folder/file', '')
+        write('other', '')
+        plan = rm('other', 'folder', 'folder/sub', recursively=True, dry_run=True)
+        self.assertEqual({'other', 'folder/file', 'folder/sub/file'}, set(plan[:3]))
+        self.assertEqual(['folder/sub', 'folder'], plan[3:])
+        self.assertEqual(['folder', 'other'], ls())
+        Interactive.ask_question = lambda _: "n"
+        self.assertEqual(['other'], rm('other', 'folder', dry_run=True))
+        rm('other', 'folder', 'folder/sub', recursively=True)
+        self.assertEqual([], ls())
+    @reset
+    def test_rm_parallel_progress(self):
+        for directory in range(4):
+            mkdir('tree/%s/inner' % directory)
+            for i in range(200):
+                write('tree/%s/inner/%s' % (directory, i), '')
+        updates = []
+        rm('tree', recursively=True, jobs=4, progress=lambda removed, total: updates.append((removed, total)))
+        self.assertEqual([], ls())
+        self.assertEqual((809, 809), updates[-1])
+        self.assertEqual(sorted(updates), updates)
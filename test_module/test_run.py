@@ -1,8 +1,11 @@
 
+import itertools
+import time
 import unittest
 
-from shell_extensions_python import write, ls, r, re, s, rm, Collect, Stdout, Stderr, Both
+from shell_extensions_python import write, ls, r, re, s, se, rm, Collect, Stdout, Stderr, Both
 from shell_extensions_python.run_shell_commands import FD
+from shell_extensions_python.process_readers import thread_reader, selector_reader, READ_SIZE
 
 from .utilities import reset
 
@@ -83,3 +86,126 @@ class TestCollectors(unittest.TestCase):
     def test_stdout_stderr(self):
         self.assertEqual((2, 3, 4, 5), s('echo 2; echo 3; sleep 0.01; echo 4 >&2; sleep 0.01; echo 5') % int >= Both())
         self.assertEqual({2, 3, 4, 5}, s('echo 2; echo 3; sleep 0.01; echo 4 >&2; sleep 0.01; echo 5') % int >= Both(set))
+
+class TestProcessChain(unittest.TestCase):
+    @reset
+    def test_two_processes(self):
+        result = s('echo 3; echo 1; echo 2') | se('sort') > Collect
+        self.assertEqual("1\n2\n3\n", result.stdout())
+        self.assertTrue(result)
+    @reset
+    def test_three_processes_and_mapper(self):
+        result = se('seq', '100000') | s('grep 7') | se('wc', '-l') | int >= Stdout()
+        self.assertEqual((40951,), result)
+    @reset
+    def test_stderr_combined(self):
+        result = s('echo a >&2; echo out') | s('cat; echo b >&2') > Collect
+        self.assertEqual("out\n", result.stdout())
+        self.assertEqual(["a", "b"], sorted(result.stderr(as_lines=True)))
+    @reset
+    def test_pipefail(self):
+        self.assertFalse(s('echo x; exit 3') | se('cat') > None)
+        self.assertEqual(3, (s('exit 3') | se('cat') > None).returncode)
+        self.assertEqual(4, (s('exit 3') | s('cat; exit 4') > None).returncode)
+        self.assertEqual(3, (s('exit 3') | s('cat') | s('cat') > None).returncode)
+    @reset
+    def test_started_process(self):
+        process = se('true')
+        process.proc.wait()
+        self.assertRaises(RuntimeError, lambda: process | se('cat'))
+        self.assertRaises(RuntimeError, lambda: se('cat') | process)
+    @reset
+    def test_start_once(self):
+        process = s('true')
+        self.assertFalse(process.started)
+        self.assertIs(process.proc, process.proc)
+        self.assertTrue(process.started)
+        self.assertRaises(RuntimeError, process._start) # pylint: disable=protected-access
+        self.assertTrue(process > None)
+
+class TestStdin(unittest.TestCase):
+    @reset
+    def test_iterable(self):
+        self.assertEqual("1\n2\n3\n", ((se('sort') < ["3", "1", "2"]) > Collect).stdout())
+        self.assertEqual("1\n2\n", (se('cat', stdin=iter([1, b"2\n"])) > Collect).stdout())
+    @reset
+    def test_pipeline_in_chain(self):
+        result = s('echo 3; echo 1; echo err >&2; echo 2') | int | (lambda x: x * 10) | se('sort', '-n') | int \
+            >= Stdout()
+        self.assertEqual((10, 20, 30), result)
+        result = s('echo 2; echo err >&2') | se('cat') > Collect
+        self.assertEqual("2\n", result.stdout())
+        self.assertEqual("err\n", result.stderr())
+    @reset
+    def test_into_process_chain(self):
+        result = s('echo b; echo a; echo b') | (lambda x: x.strip().upper()) | (se('sort') | se('uniq')) > Collect
+        self.assertEqual("A\nB\n", result.stdout())
+    @reset
+    def test_large_input_and_output(self):
+        lines = ("%s" % i for i in range(200000))
+        self.assertEqual(200000, len(se('cat', stdin=lines) >= Stdout(list)))
+    @reset
+    def test_exit_codes(self):
+        self.assertEqual(3, (s('echo a; exit 3') | se('cat') > None).returncode)
+        self.assertEqual(3, (s('echo a; exit 2') | s('cat; exit 3') > None).returncode)
+        self.assertEqual(0, (s('echo a') | s('cat') > None).returncode)
+    @reset
+    def test_stdin_closed_early(self):
+        result = se('head', '-n', '1', stdin=("%s" % i for i in range(100000))) > Collect
+        self.assertEqual("0\n", result.stdout())
+        self.assertTrue(result)
+    @reset
+    def test_infinite_source(self):
+        start = time.time()
+        result = se('head', '-n', '1', stdin=itertools.count()) > Collect
+        self.assertEqual("0\n", result.stdout())
+        self.assertTrue(result)
+        result = se('yes') | str.strip | se('head', '-n', '1') > Collect
+        self.assertEqual("y\n", result.stdout())
+        self.assertTrue(result)
+        self.assertLess(time.time() - start, 2)
+    @reset
+    def test_invalid_stdin(self):
+        process = se('cat', stdin=[])
+        self.assertRaises(RuntimeError, lambda: process < [])
+        self.assertRaises(RuntimeError, lambda: se('cat') | se('cat', stdin=[]))
+    @reset
+    def test_failing_source(self):
+        self.assertRaises(ValueError, lambda: s('echo a') | int | se('cat') > Collect)
+        self.assertRaises(ValueError, lambda: se('cat', stdin=(int(x) for x in "1a")) > Collect)
+
+class TestChunks(unittest.TestCase):
+    @reset
+    def test_chunks(self):
+        for reader in thread_reader, selector_reader:
+            blocks = list(se('head', '-c', '100000', '/dev/zero', chunks=1000, reader=reader))
+            self.assertTrue(all(fd == FD.stdout and isinstance(block, bytes) for fd, block in blocks))
+            self.assertTrue(all(len(block) <= 1000 for _, block in blocks))
+            self.assertEqual(100000, sum(len(block) for _, block in blocks))
+    @reset
+    def test_split_characters(self):
+        result = r('printf "\\316\\273\\316\\273\\n"', mode=Collect, chunks=1)
+        self.assertEqual(5, len(result.stdout(raw=True)))
+        self.assertEqual("λλ\n", result.stdout())
+    @reset
+    def test_default_size(self):
+        blocks = s('echo abc; echo def', chunks=True) >= Stdout()
+        self.assertEqual(b"abc\ndef\n", b"".join(blocks))
+        self.assertTrue(all(len(block) <= READ_SIZE for block in blocks))
+    @reset
+    def test_invalid(self):
+        self.assertRaises(ValueError, lambda: s('true', chunks=-1))
+        self.assertRaises(ValueError, lambda: s('true', chunks=1.5))
+
+class TestTerminate(unittest.TestCase):
+    @reset
+    def test_terminate_running(self):
+        process = se('sleep', '5')
+        process.proc # pylint: disable=pointless-statement
+        process.terminate()
+        self.assertFalse(process > None)
+    @reset
+    def test_terminate_before_start(self):
+        process = se('sleep', '5') | se('cat')
+        process.terminate()
+        self.assertFalse(process > None)
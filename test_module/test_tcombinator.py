@@ -19,3 +19,48 @@ class TestTCombinator(unittest.TestCase):
             sleep(0.2)
             yield 4
         self.assertEqual([1, 2, 3, 4, 5], list(TCombinator(generator1(), generator2())))
+    def test_small_capacity(self):
+        def generator(start):
+            for i in range(start, 1000, 2):
+                yield i
+        result = list(TCombinator(generator(0), generator(1), capacity=1))
+        self.assertEqual(list(range(1000)), sorted(result))
+        self.assertEqual(list(range(0, 1000, 2)), [x for x in result if x % 2 == 0])
+        self.assertEqual(list(range(1, 1000, 2)), [x for x in result if x % 2 == 1])
+    def test_batches(self):
+        def generator():
+            yield from range(100)
+        batches = list(TCombinator(generator(), capacity=10).batches())
+        self.assertEqual(list(range(100)), [x for batch in batches for x in batch])
+        self.assertTrue(all(batch for batch in batches))
+    def test_close(self):
+        closed = []
+        def generator():
+            try:
+                yield from range(10 ** 9)
+            finally:
+                closed.append(True)
+        batches = TCombinator(generator(), capacity=10).batches()
+        self.assertEqual(0, next(batches)[0])
+        batches.close()
+        for _ in range(100):
+            if closed:
+                break
+            sleep(0.01)
+        self.assertEqual([True], closed)
+    def test_invalid_capacity(self):
+        self.assertRaises(ValueError, lambda: TCombinator(capacity=0))
+    def test_no_generators(self):
+        self.assertEqual([], list(TCombinator()))
+    def test_exception(self):
+        def failing():
+            yield 1
+            raise ValueError("failed")
+        def succeeding():
+            sleep(0.1)
+            yield 2
+        result = []
+        with self.assertRaises(ValueError):
+            for item in TCombinator(failing(), succeeding()):
+                result.append(item)
+        self.assertEqual([1, 2], result)
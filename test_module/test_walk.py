@@ -0,0 +1,83 @@
+import os
+import unittest
+
+from shell_extensions_python import write, mkdir, rm, find, head, Stdout, Both
+from shell_extensions_python.interactive import FileType
+from shell_extensions_python.walk import walk
+
+from .utilities import reset
+
+class TestWalk(unittest.TestCase):
+    @reset
+    def test_walk(self):
+        mkdir('a/b')
+        write('a/b/c.py', '')
+        write('a/d.txt', '')
+        write('e.py', '')
+        self.assertEqual(['./a/b/c.py', './a/d.txt', './e.py'], list(walk('.')))
+        self.assertEqual(['./a/b/c.py', './e.py'], list(walk('.', glob='*.py')))
+        self.assertEqual(['e.py'], list(walk('e.py')))
+        rm('a', recursively=True)
+        rm('e.py')
+    @reset
+    def test_gitignore(self):
+        mkdir('build/x')
+        mkdir('src/build')
+        mkdir('.git')
+        write('.git/config', '')
+        write('build/x/out', '')
+        write('src/build/keep', '')
+        write('src/a.log', '')
+        write('src/important.log', '')
+        write('src/main.c', '')
+        write('.gitignore', '/build/\n*.log\n!important.log\n')
+        write('src/.gitignore', '*.c\n')
+        self.assertEqual(['./.gitignore', './src/.gitignore', './src/build/keep', './src/important.log'],
+                         list(walk('.')))
+        self.assertEqual(7, len(list(walk('.', gitignore=False))))
+        for path in 'build', 'src', '.git', '.gitignore':
+            rm(path, recursively=True)
+    @reset
+    def test_find(self):
+        mkdir('a/b/c')
+        write('a/b/c/d.py', '')
+        write('a/e.txt', '')
+        write('a/f.py', '')
+        for jobs in None, 4:
+            self.assertEqual(('.', './a', './a/b', './a/b/c', './a/b/c/d.py', './a/e.txt', './a/f.py'),
+                             find('.', jobs=jobs) >= Stdout())
+        self.assertEqual(('a/b/c/d.py', 'a/f.py'), find('a', name='*.py') >= Stdout())
+        self.assertEqual(('a', 'a/b', 'a/b/c'), find('a', type='d') >= Stdout())
+        self.assertEqual(('a/b', 'a/e.txt', 'a/f.py'), find('a', mindepth=1, maxdepth=1) >= Stdout())
+        self.assertEqual(('a', 'a/b', 'a/e.txt', 'a/f.py'), find('a', prune='b*') >= Stdout())
+        self.assertEqual(('a/e.txt', 'a/f.py'), find('a', type='f', prune=lambda path: path == 'a/b') >= Stdout())
+        os.utime('a/e.txt', (0, 0))
+        os.utime('a/f.py', (0, 0))
+        self.assertEqual(('a/b/c/d.py',), find('a', type='f', newer='a/f.py') >= Stdout())
+        self.assertEqual(('a', 'a/b'), find('a') | head(2) >= Stdout())
+        self.assertEqual(FileType.directory, (find('a', maxdepth=0) >= Stdout())[0].type)
+        self.assertEqual(FileType.normal_file, (find('a', name='*.txt') >= Stdout())[0].type)
+        pipeline = find('nonexistant')
+        self.assertEqual(1, len(pipeline >= Both()))
+        self.assertEqual(1, pipeline.exitcode)
+        self.assertRaises(ValueError, lambda: find(type='x'))
+        rm('a', recursively=True)
+    @reset
+    def test_find_jobs_frees_scans(self):
+        mkdir('/'.join('d' * 30))
+        pipeline = find('d', jobs=2)
+        pending = [len(pipeline._Find__scans) for _ in pipeline] # pylint: disable=protected-access
+        self.assertEqual(30, len(pending))
+        self.assertLessEqual(max(pending), 1)
+        rm('d', recursively=True)
+    @reset
+    def test_find_gitignore(self):
+        mkdir('build')
+        mkdir('.git')
+        write('build/out', '')
+        write('main.c', '')
+        write('.gitignore', 'build/\n')
+        self.assertEqual(('.', './.gitignore', './main.c'), find(gitignore=True) >= Stdout())
+        self.assertEqual(6, len(find() >= Stdout()))
+        for path in 'build', 'main.c', '.git', '.gitignore':
+            rm(path, recursively=True)